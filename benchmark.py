@@ -0,0 +1,189 @@
+import argparse
+import os
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+import tracemalloc
+import pandas as pd
+from bs4 import BeautifulSoup
+import wikipedia
+
+corpus_dir = "benchmark_corpus"
+import_modules = ["preprocessing", "transforming", "sql_lib", "visualization", "cleaning", "wikipedia"]
+import_report_path = "reports/import_times.csv"
+
+
+def record_corpus(years = wikipedia.years, corpus_dir = corpus_dir, offline = False):
+    """
+    Stores the Wikipedia page of every year in `corpus_dir`/<year>.html so that benchmarks
+    always run against the same pages.
+
+    Args:
+        - years: List of integers representing the years to record.
+        - corpus_dir: Directory where the pages are stored.
+        - offline: If True, pages are taken only from the page cache.
+
+    Returns:
+        None
+    """
+    os.makedirs(corpus_dir, exist_ok = True)
+    pages = wikipedia.get_year_pages(years, offline = offline)
+    for year, raw_web in pages.items():
+        with open(f"{corpus_dir}/{year}.html", "wb") as f:
+            f.write(raw_web)
+    print(f"{len(pages)} pages recorded in /{corpus_dir}")
+
+
+def golden_check(df, path):
+    """
+    Compares a DataFrame with the csv file it should produce.
+
+    Returns:
+        True if the csv text is identical, False if it differs and None if there is no golden file.
+    """
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding = "utf-8") as f:
+        golden = f.read()
+    return df.to_csv(index = False).replace("\r\n", "\n") == golden.replace("\r\n", "\n")
+
+
+def benchmark_year(year, corpus_dir = corpus_dir):
+    """
+    Runs every stage of the scraper on the recorded page of a year and times it.
+
+    Args:
+        - year: Year of the page to benchmark.
+        - corpus_dir: Directory of the recorded pages.
+
+    Returns:
+        A dictionary with the seconds spent on the "fetch" (read from disk), "parse", "locate"
+        and "build" stages, the "peak_mb" of memory allocated during the year and the result of
+        the golden check of the "points" and "songs" tables.
+    """
+    tracemalloc.reset_peak()
+    result = {"year" : year}
+
+    start = time.perf_counter()
+    with open(f"{corpus_dir}/{year}.html", "rb") as f:
+        raw_web = f.read()
+    result["fetch"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    soup = BeautifulSoup(raw_web, wikipedia.parser, parse_only = wikipedia.wikitables)
+    tables = soup.find_all("table", class_ = "wikitable")
+    result["parse"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    votes_table = wikipedia.find_votes_table(tables)
+    songs_table = wikipedia.find_songs_table(tables)
+    result["locate"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    frames = {}
+    if votes_table is not None and year < 2016:
+        frames["points"] = wikipedia.bs4_to_pandas_votes(votes_table)
+    if songs_table is not None:
+        frames["songs"] = wikipedia.bs4_to_pandas_songs(songs_table)
+    for df in frames.values():
+        df["Year"] = year
+    result["build"] = time.perf_counter() - start
+
+    result["peak_mb"] = tracemalloc.get_traced_memory()[1] / 1024 ** 2
+    folders = {"points" : "puntos_por_anho", "songs" : "canciones_por_anho"}
+    for kind, folder in folders.items():
+        result[kind] = golden_check(frames[kind], f"{folder}/{year}.csv") if kind in frames else None
+    return result
+
+
+def run_benchmark(corpus_dir = corpus_dir):
+    """
+    Benchmarks the scraper on every page recorded in `corpus_dir` and prints the time per stage
+    and year, the totals, the peak memory and the years whose output differs from the csv files
+    in /puntos_por_anho and /canciones_por_anho.
+
+    Returns:
+        pd.DataFrame - A row per year with the columns described in `benchmark_year`.
+    """
+    years = sorted(int(file.split(".")[0]) for file in os.listdir(corpus_dir) if file.endswith(".html"))
+
+    tracemalloc.start()
+    results = pd.DataFrame([benchmark_year(year, corpus_dir) for year in years]).set_index("year")
+    tracemalloc.stop()
+
+    stages = ["fetch", "parse", "locate", "build"]
+    pd.set_option("display.max_rows", None)
+    print(results.round(4))
+    print("\nTotal seconds per stage:")
+    print(results[stages].sum().round(3).to_string())
+    print(f"Total: {results[stages].sum().sum():.3f} s, peak memory: {results['peak_mb'].max():.1f} MB")
+
+    for kind in ["points", "songs"]:
+        mismatches = results.index[results[kind] == False].tolist()
+        print(f"Golden check {kind}: {(results[kind] == True).sum()} identical, mismatches: {mismatches}")
+    return results
+
+
+def import_time(module, runs = 5):
+    """
+    Measures how long it takes to import a module in a new Python process (cold start, without the
+    modules already imported by this process).
+
+    Args:
+        - module: Name of the module, e.g. "preprocessing".
+        - runs: Number of processes to measure.
+
+    Returns:
+        A list with the seconds of every run. It is empty if the module can not be imported.
+    """
+    code = f"import time; start = time.perf_counter(); import {module}; print(time.perf_counter() - start)"
+    times = []
+    for _ in range(runs):
+        process = subprocess.run([sys.executable, "-c", code], capture_output = True, text = True)
+        if process.returncode != 0:
+            print(f"    {module} can not be imported: {process.stderr.strip().splitlines()[-1]}")
+            return []
+        times.append(float(process.stdout.strip().splitlines()[-1]))
+    return times
+
+
+def benchmark_imports(modules = import_modules, runs = 5, path = import_report_path):
+    """
+    Measures the cold start of every module (see `import_time`), prints it and appends it to the csv file
+    in `path` with the time of the measure, so that the import time can be followed over time.
+
+    Returns:
+        pd.DataFrame - A row per module with the "median", "min" and "max" seconds of its import.
+    """
+    rows = []
+    measured = datetime.now(timezone.utc).isoformat(timespec = "seconds")
+    for module in modules:
+        times = import_time(module, runs)
+        if times:
+            rows.append({"measured" : measured, "module" : module, "runs" : runs,
+                         "median" : float(pd.Series(times).median()), "min" : min(times), "max" : max(times)})
+    results = pd.DataFrame(rows)
+    print(results.drop(columns = "measured").round(3).to_string(index = False))
+
+    if len(results):
+        os.makedirs(os.path.dirname(path), exist_ok = True)
+        results.to_csv(path, mode = "a", header = not os.path.exists(path), index = False)
+        print(f"Import times appended to /{path}")
+    return results
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description = "Benchmark the Wikipedia scraper on recorded pages.")
+    arg_parser.add_argument("--corpus", default = corpus_dir, help = "directory of the recorded pages")
+    arg_parser.add_argument("--record", action = "store_true", help = "record the pages before benchmarking")
+    arg_parser.add_argument("--offline", action = "store_true", help = "record only from the page cache")
+    arg_parser.add_argument("--imports", action = "store_true", help = "benchmark the import time of the modules instead")
+    args = arg_parser.parse_args()
+
+    if args.imports:
+        benchmark_imports()
+    else:
+        if args.record:
+            record_corpus(corpus_dir = args.corpus, offline = args.offline)
+        run_benchmark(args.corpus)
@@ -1,52 +1,51 @@
 import pandas as pd
 import os
-import numpy as np
 import random
 import matplotlib.pyplot as plt
+from concurrent.futures import ProcessPoolExecutor
+from schema import apply_schema, compact, floats_to_int, parse_loudness
+from storage import read_excel_cached, write_cleaned
 
-def replace_nulls(filename):
+def replace_nulls(df):
     """
-    Replaces null values in a CSV file with 0 and changes the dtype of the column to int.
+    Replaces null values in a points DataFrame with 0 and changes the dtype of the columns to int.
 
     Parameters
     ----------
-    filename : str
-        The file path of the CSV file to be cleaned.
+    df : pd.DataFrame
+        A DataFrame read from a file in the "puntos_por_anho/" directory.
 
     Returns
     -------
-    None
-        This function does not return a value, but saves the cleaned data to a new CSV file in the
-        "cleaned_data/puntos_por_anho/" directory with the same filename as the original file.
+    pd.DataFrame
+        The cleaned DataFrame. The input DataFrame is not modified.
     """
 
-    df = pd.read_csv(f"puntos_por_anho/{filename}")
-    df.fillna(0, inplace = True)
+    df = df.fillna(0)
     columns = df.columns
     for column in columns:
         if "Country" in column or "Contestants" in column:
             pass
         else:
             df[column] = df[column].astype(int)
-    df.to_csv(f"cleaned_data/puntos_por_anho/{filename}")
+    return df
 
 
-def rename_cols(filename):
+def rename_cols(df):
     """
     Rename columns to remove Wikipedia notations.
 
     Parameters
     ----------
-    filename : str
-        The file path to the CSV file to be cleaned.
+    df : pd.DataFrame
+        A DataFrame read from a file in the "canciones_por_anho/" directory.
 
     Returns
     -------
-    None
-        The function overwrites the input file with the cleaned version.
+    pd.DataFrame
+        The DataFrame with the cleaned column names. The input DataFrame is not modified.
     """
 
-    df = pd.read_csv(f"canciones_por_anho/{filename}")
     columns = df.columns
     new_columns = []
     for col in columns:
@@ -55,8 +54,70 @@ def rename_cols(filename):
         else:
             new_col = col
         new_columns.append(new_col)
-    df.rename(columns = dict(zip(columns, new_columns)), inplace = True)
-    df.to_csv(f"cleaned_data/canciones_por_anho/{filename}")
+    return df.rename(columns = dict(zip(columns, new_columns)))
+
+
+def clean_year_file(folder, filename, transforms, checkpoint = False):
+    """
+    Reads a file from a per year directory and chains the given transforms on it.
+
+    Parameters
+    ----------
+    folder : str
+        The per year directory, "puntos_por_anho" or "canciones_por_anho".
+    filename : str
+        The name of the CSV file in `folder`.
+    transforms : list
+        Functions taking and returning a DataFrame, applied in order.
+    checkpoint : bool
+        If True, the cleaned DataFrame is also saved to "cleaned_data/<folder>/" as Parquet.
+
+    Returns
+    -------
+    pd.DataFrame
+        The cleaned DataFrame, with the dtypes declared for `folder` in schema.schemas.
+    """
+
+    df = pd.read_csv(f"{folder}/{filename}")
+    for transform in transforms:
+        df = df.pipe(transform)
+    if checkpoint:
+        return write_cleaned(df, folder, filename, schema = folder)
+    return apply_schema(df, folder)
+
+
+def clean_year_files(folder, transforms, files = None, processes = None, checkpoint = False):
+    """
+    Cleans every file of a per year directory, fanning the files out over a process pool.
+
+    Parameters
+    ----------
+    folder : str
+        The per year directory, "puntos_por_anho" or "canciones_por_anho".
+    transforms : list
+        Functions taking and returning a DataFrame, applied in order. They must be defined at
+        module level so they can be sent to the worker processes.
+    files : list, optional
+        The files to clean. Defaults to every file in `folder`.
+    processes : int, optional
+        Number of worker processes. Defaults to the number of CPUs, 1 cleans the files in this process.
+    checkpoint : bool
+        If True, every cleaned DataFrame is also saved to "cleaned_data/<folder>/" as Parquet.
+
+    Returns
+    -------
+    dict
+        The file names as keys and the cleaned DataFrames as values, sorted by file name.
+    """
+
+    files = sorted(os.listdir(folder) if files is None else files)
+    if processes == 1:
+        frames = [clean_year_file(folder, file, transforms, checkpoint) for file in files]
+    else:
+        with ProcessPoolExecutor(max_workers = processes) as executor:
+            futures = [executor.submit(clean_year_file, folder, file, transforms, checkpoint) for file in files]
+            frames = [future.result() for future in futures]
+    return dict(zip(files, frames))
 
 def change_dtype(df):
     """
@@ -72,11 +133,9 @@ def change_dtype(df):
     pd.DataFrame
         The Pandas DataFrame with columns having updated data types.
     """
-    cols = df.columns
-    for col in cols:
-        if df[col].dtype == "float64":
-            df[col] = df[col].apply(lambda x: int(round(x))).astype("int64")
-        elif col in ["BPM","energy","danceability","happiness","liveness","speechiness"]:
+    floats_to_int(df)
+    for col in ["BPM","energy","danceability","happiness","liveness","speechiness"]:
+        if col in df.columns and df[col].dtype != "int64":
             df[col] = df[col].astype("int64")
 
 def convert_loudness(loudness):
@@ -97,7 +156,8 @@ def convert_loudness(loudness):
     ------------
     This function takes a pandas Series containing loudness values in different formats and
     converts them to a consistent format. It removes any dB notation and makes all values
-    negative. Finally, it rounds the values to the nearest integer.
+    negative. Finally, it rounds the values to the nearest integer. The work is done with
+    vectorised string and number operations by schema.parse_loudness.
 
     Examples:
     ---------
@@ -110,10 +170,20 @@ def convert_loudness(loudness):
     3    -6.0
     dtype: float64
     """
-    loudness = pd.to_numeric(loudness.apply(lambda x: x.split(" ")[0] if type(x) == str else x))
-    loudness = np.where(loudness > 0, loudness * -1, loudness)
-    loudness = loudness.round()
-    return loudness
+    return parse_loudness(loudness)
+
+colours = [
+    'cornflowerblue', # Azul claro
+    'mediumaquamarine', # Verde agua
+    'lightcoral', # Coral claro
+    'paleturquoise', # Turquesa claro
+    'lemonchiffon', # Amarillo claro
+    'lavender', # Lavanda
+    'rosybrown', # Marrón rosado
+    'palegoldenrod', # Beige dorado claro
+    'lightsteelblue', # Azul acero claro
+    'thistle' # Cardo
+    ]
 
 def plot_bars(col, df):
     """
@@ -130,19 +200,6 @@ def plot_bars(col, df):
     -------
     None
     """
-    colours = [
-    'cornflowerblue', # Azul claro
-    'mediumaquamarine', # Verde agua
-    'lightcoral', # Coral claro
-    'paleturquoise', # Turquesa claro
-    'lemonchiffon', # Amarillo claro
-    'lavender', # Lavanda
-    'rosybrown', # Marrón rosado
-    'palegoldenrod', # Beige dorado claro
-    'lightsteelblue', # Azul acero claro
-    'thistle' # Cardo
-    ]
-
     x = df[col].value_counts().keys()
     x = [str(i) for i in x]
     y = df[col].value_counts().values
@@ -152,23 +209,87 @@ def plot_bars(col, df):
     plt.show()
 
 
-def clean_all_data():
+def render_bars(col, x, y, path):
+    """
+    Render a bar chart to a file without a display, so it can run in a worker process.
+
+    It uses a matplotlib Figure directly instead of pyplot, which renders with the
+    non-interactive Agg backend and keeps no global state.
+
+    Parameters
+    ----------
+    col : str
+        Name of the column, used as the title.
+    x : list
+        Labels of the bars.
+    y : list
+        Heights of the bars.
+    path : str
+        File to write, the format is taken from its extension (".png", ".svg").
+
+    Returns
+    -------
+    str
+        The path of the file written.
+    """
+    from matplotlib.figure import Figure
+
+    fig = Figure()
+    ax = fig.subplots()
+    ax.bar(x, y, color = random.choice(colours))
+    ax.set_title(col)
+    ax.set_ylabel("count")
+    fig.savefig(path)
+    return path
+
+
+def submit_plot_bars(executor, col, df, report_dir, plot_format = "png"):
+    """
+    Send the bar chart of a column to a worker pool, see `render_bars`.
+
+    Only the counts of the column are sent to the worker, not the whole DataFrame.
+
+    Parameters
+    ----------
+    executor : concurrent.futures.Executor
+        The pool rendering the figures.
+    col : str
+        Name of the column in the DataFrame to plot.
+    df : pd.DataFrame
+        DataFrame containing the data to plot.
+    report_dir : str
+        Directory where the figure is written as "<col>.<plot_format>".
+    plot_format : str
+        "png" or "svg".
+
+    Returns
+    -------
+    concurrent.futures.Future
+        The future of the path of the figure.
+    """
+    counts = df[col].value_counts()
+    x = [str(i) for i in counts.keys()]
+    path = os.path.join(report_dir, f"{col}.{plot_format}")
+    return executor.submit(render_bars, col, x, counts.values.tolist(), path)
+
+
+def clean_all_data(checkpoint = True, processes = None, plots = "show",
+                   report_dir = "reports/cleaning", plot_format = "png"):
     """
     Cleans up the Eurovision Song Contest data stored in various files and 
-    stores the cleaned data in a new file in the 'cleaned_data' directory.
+    returns the cleaned data, optionally storing it in the 'cleaned_data' directory.
 
     The function replaces null values with 0 and changes the dtype of the columns
-    in the csv files in the 'puntos_por_anho' and 'canciones_por_anho' directories.
-    It also changes column names and removes Wikipedia notations in the csv files
-    in the 'canciones_por_anho' directory.
+    in the csv files in the 'puntos_por_anho' directory (except the 2016 onwards jury
+    and televote files) and removes Wikipedia notations from the column names in the
+    csv files in the 'canciones_por_anho' directory. The files are cleaned in memory,
+    in parallel over `processes` worker processes.
 
-    The 'song_data_completo.xlsx' file is cleaned by replacing "-" with 0 in certain columns
+    The 'song_data_completo.xlsx' file is read through a cache keyed by its hash (see
+    storage.read_excel_cached) and cleaned by replacing "-" with 0 in certain columns
     and dropping redundant and non-informative columns.
 
-    The cleaned 'songs_df' DataFrame is stored in a new file in the 'cleaned_data' directory
-    named 'songs_cleaned.csv'.
-
-    It plots and then drops redundant and non informative columns:
+    It plots (see `plots`) and then drops redundant and non informative columns:
         direct_qualifier_10
         age
         selection
@@ -182,25 +303,43 @@ def clean_all_data():
         final_total_points
         semi_total_points
         race
-    It then stores the cleaned file in the path
-        /cleaned_data/songs_cleaned.csv
     
+    Args:
+        checkpoint: If True, the cleaned files are also stored as Parquet in the paths
+            /cleaned_data/puntos_por_anho/filename.parquet
+            /cleaned_data/canciones_por_anho/filename.parquet
+            /cleaned_data/songs_cleaned.parquet
+        processes: Number of worker processes used to clean the per year files.
+            Defaults to the number of CPUs.
+        plots: What to do with the bar charts of the dropped columns:
+            "show" - show them with plt.show(), blocking until each one is closed.
+            "none" - headless, skip the figures entirely.
+            "files" - render them in a background worker pool with a non-interactive
+                backend and write them to `report_dir` while cleaning carries on.
+        report_dir: Directory of the figures when plots = "files".
+        plot_format: "png" or "svg", format of the figures when plots = "files".
+
     Returns:
-        None
+        A dictionary with the cleaned data, with the dtypes declared in schema.schemas,
+        ready to be handed to transforming.build_tables:
+            "puntos_por_anho": dictionary with the file names and their DataFrames
+            "canciones_por_anho": dictionary with the file names and their DataFrames
+            "songs_cleaned": DataFrame
     """
-    # Cleaning data in /canciones_por_anho and /puntos_por_anho
+    if plots not in ["show", "none", "files"]:
+        raise ValueError(f"plots must be 'show', 'none' or 'files', not {plots!r}")
 
-    puntos_por_anho_dir = os.listdir("puntos_por_anho")
-    for file in puntos_por_anho_dir[:len(puntos_por_anho_dir)-12]:
-        replace_nulls(file)
+    # Cleaning data in /canciones_por_anho and /puntos_por_anho
 
-    canc_por_anho_dir = os.listdir("canciones_por_anho")
-    for file in canc_por_anho_dir:
-        rename_cols(file)
+    puntos_files = [file for file in os.listdir("puntos_por_anho") if "vote" not in file]
+    puntos_por_anho = clean_year_files("puntos_por_anho", [replace_nulls], puntos_files,
+                                       processes, checkpoint)
+    canciones_por_anho = clean_year_files("canciones_por_anho", [rename_cols], None,
+                                          processes, checkpoint)
 
     # Cleaning songs_df
 
-    songs_df = pd.read_excel("song_data_completo.xlsx")
+    songs_df = read_excel_cached("song_data_completo.xlsx")
     songs_df.drop(528, axis = 0, inplace = True) # null values in row 528
 
     # Replacing "-" with 0
@@ -219,8 +358,15 @@ def clean_all_data():
         'final_televote_votes', 'final_total_points', 'semi_total_points', 
         'race', "age"]
     
-    for col in to_drop:
-        plot_bars(col, songs_df)
+    figures = []
+    if plots == "show":
+        for col in to_drop:
+            plot_bars(col, songs_df)
+    elif plots == "files":
+        os.makedirs(report_dir, exist_ok = True)
+        plotter = ProcessPoolExecutor(max_workers = 2)
+        figures = [submit_plot_bars(plotter, col, songs_df, report_dir, plot_format) for col in to_drop]
+        plotter.shutdown(wait = False)
 
     songs_df.drop(to_drop, axis = 1, inplace = True)
     songs_df.drop(songs_df[songs_df['key'] == "-"].index, axis=0, inplace= True)
@@ -228,7 +374,19 @@ def clean_all_data():
 
     songs_df['loudness'] = convert_loudness(songs_df['loudness'])
     change_dtype(songs_df)
-
-    songs_df.to_csv("cleaned_data/songs_cleaned.csv",index = False)
-
-    print("Data cleaned and stored in /cleaned_data")
\ No newline at end of file
+    songs_df = compact(songs_df, "songs_cleaned", schema = "songs_cleaned")
+
+    if checkpoint:
+        songs_df = write_cleaned(songs_df, "", "songs_cleaned.csv", schema = "songs_cleaned")
+        print("Data cleaned and stored in /cleaned_data")
+    else:
+        print("Data cleaned")
+
+    if figures:
+        paths = [figure.result() for figure in figures]
+        print(f"{len(paths)} figures written to /{report_dir}")
+
+    return {
+        "puntos_por_anho" : puntos_por_anho,
+        "canciones_por_anho" : canciones_por_anho,
+        "songs_cleaned" : songs_df}
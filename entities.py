@@ -0,0 +1,110 @@
+import json
+import os
+import re
+import numpy as np
+import pandas as pd
+
+entities_path = "cleaned_data/entities.json"
+
+
+def canonical_country(value):
+    """
+    Returns the canonical spelling of a country, e.g. "Yugoslavia" for " Yugoslavia".
+    """
+    return " ".join(str(value).replace("\xa0", " ").split())
+
+
+def canonical_language(value):
+    """
+    Returns the canonical spelling of a language or a combination of languages: without footnotes
+    ("[a]"), non-breaking spaces or stray spaces, and with the languages sorted,
+    e.g. "Armenian, English" for "English,\xa0Armenian[b]".
+    """
+    value = re.sub(r"\[[^\]]*\]", "", str(value).replace("\xa0", " "))
+    languages = {" ".join(language.split()) for language in value.split(",")} - {""}
+    return ", ".join(sorted(languages))
+
+
+# Rules that give the canonical spelling of a raw value, by kind of entity
+rules = {
+    "country" : canonical_country,
+    "language" : canonical_language}
+
+
+def load_entities(path = entities_path):
+    """
+    Load the persistent index that maps every raw spelling seen so far to its canonical entity.
+
+    Parameters:
+    - path: str - The path of the JSON file with the index.
+
+    Returns:
+    - dict - A dictionary per kind of entity ("country", "language") with the raw spellings as keys and
+      the canonical spellings as values. Empty if the file does not exist.
+    """
+    if not os.path.exists(path):
+        return {kind: {} for kind in rules}
+    with open(path, "r", encoding = "utf-8") as f:
+        entities = json.load(f)
+    return {kind: entities.get(kind, {}) for kind in rules}
+
+
+def update_entities(values, kind, path = entities_path):
+    """
+    Add the raw spellings of a column that are not in the index yet, with the canonical spelling given by
+    the rule of their kind (see `rules`), and save the index. This is the only function that writes the
+    index: run it when new data brings new spellings, review the file and commit it.
+
+    Parameters:
+    - values: pd.Series - The raw values.
+    - kind: str - The kind of entity, "country" or "language".
+    - path: str - The path of the JSON file with the index.
+
+    Returns:
+    - dict - The new spellings and their canonical spelling.
+
+    Example usage:
+    ```
+    update_entities(pd.read_csv("cleaned_data/clean_2023.csv")["language"], "language")
+    ```
+    """
+    entities = load_entities(path)
+    aliases = entities[kind]
+    raw_names = {str(value) for value in pd.Series(values).dropna().unique()}
+    new_aliases = {name: rules[kind](name) for name in sorted(raw_names - set(aliases))}
+    if new_aliases:
+        aliases.update(new_aliases)
+        with open(path, "w", encoding = "utf-8") as f:
+            json.dump(entities, f, indent = 1, ensure_ascii = False, sort_keys = True)
+    return new_aliases
+
+
+def resolve(values, kind, path = entities_path):
+    """
+    Replace the raw spellings of a column by their canonical entity, with a single lookup per distinct value.
+    Spellings that are not in the index are resolved with the rule of their kind (see `rules`) without
+    saving them, so computing a table never writes the index, an input of the pipeline stages. New spellings
+    are added with `update_entities`, and the index can be corrected by hand in the file.
+
+    Parameters:
+    - values: pd.Series - The raw values. Missing values stay missing.
+    - kind: str - The kind of entity, "country" or "language".
+    - path: str - The path of the JSON file with the index.
+
+    Returns:
+    - pd.Series - The canonical values as a categorical, with the index of `values`.
+
+    Example usage:
+    ```
+    df["language"] = resolve(df["language"], "language")
+    ```
+    """
+    raw = pd.Categorical(values)
+    raw_names = [str(category) for category in raw.categories]
+    aliases = load_entities(path)[kind]
+    canonical = [aliases[name] if name in aliases else rules[kind](name) for name in raw_names]
+    categories = pd.Index(sorted(set(canonical)))
+    # Missing values have the code -1, which picks the -1 appended at the end
+    codes = np.append(categories.get_indexer(canonical), -1)
+    resolved = pd.Categorical.from_codes(codes[raw.codes], categories)
+    return pd.Series(resolved, index = values.index, name = values.name)
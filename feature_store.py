@@ -0,0 +1,191 @@
+import hashlib
+import json
+import os
+import pickle
+import shutil
+from datetime import datetime, timezone
+import numpy as np
+import pandas as pd
+import pipeline
+from entities import resolve
+
+store_dir = "cache/features"
+
+# Columns of the design matrix: one-hot encoded, standardised and passed as they are
+feature_columns = {
+    "categorical" : ["key", "style", "gender", "language"],
+    "scaled" : ["BPM", "energy", "danceability", "happiness", "loudness", "liveness", "speechiness"],
+    "passthrough" : ["main_singers", "backing_dancers", "backing_singers", "backing_instruments",
+                     "instrument_10", "favourite_10", "host_10"]}
+
+
+def data_version(training, prediction, columns = feature_columns):
+    """
+    Returns the version of the features of some source tables: a hash of their contents, of the
+    columns of the design matrix and of the code that builds it. The same tables always give the same version.
+    """
+    sha256 = hashlib.sha256(json.dumps(columns, sort_keys = True).encode())
+    sha256.update(pipeline.code_hash(build_features).encode())
+    for df in (training, prediction):
+        sha256.update(json.dumps([str(col) for col in df.columns]).encode())
+        sha256.update(pd.util.hash_pandas_object(df.astype(str), index = False).to_numpy().tobytes())
+    return sha256.hexdigest()[:16]
+
+
+def categorical_values(df, columns):
+    """
+    Returns the categorical columns as lowercase text without surrounding spaces, so "E Minor" and "e minor "
+    are the same category, and with the languages in their canonical spelling (see entities.resolve), so
+    "Serbian, English" in 2023 is the "English, Serbian" of training. The index of entities is only read.
+    Missing values become "missing".
+    """
+    values = df[columns].astype(object)
+    if "language" in columns:
+        values["language"] = resolve(values["language"], "language").astype(object)
+    return values.fillna("missing").astype(str).apply(lambda col: col.str.strip().str.lower())
+
+
+def build_features(training, prediction, columns = feature_columns):
+    """
+    Builds the design matrices of the training songs and the songs of 2023 with the same fitted transformers:
+    a OneHotEncoder on the categorical columns (categories not seen in training are all zeros), a StandardScaler
+    on the audio features and the passthrough columns as they are. Missing numbers are filled with the median
+    of the training songs.
+
+    Args:
+        training: pd.DataFrame - The training songs, see preprocessing.training_data.
+        prediction: pd.DataFrame - The songs of 2023, see preprocessing.prediction_data.
+        columns: dict - The columns of the design matrix, see `feature_columns`.
+
+    Returns:
+        dict - "X", "y" (top five or not, see preprocessing.create_target_variable) and "X_2023" as NumPy
+        arrays, the "feature_names" and the fitted "transformers" (encoder, scaler and medians).
+    """
+    from sklearn.preprocessing import OneHotEncoder, StandardScaler
+    from preprocessing import create_target_variable
+
+    numeric = columns["scaled"] + columns["passthrough"]
+    medians = training[numeric].apply(pd.to_numeric, errors = "coerce").median()
+
+    def numbers(df):
+        return df[numeric].apply(pd.to_numeric, errors = "coerce").fillna(medians)
+
+    encoder = OneHotEncoder(handle_unknown = "ignore")
+    encoder.fit(categorical_values(training, columns["categorical"]))
+    scaler = StandardScaler()
+    scaler.fit(numbers(training)[columns["scaled"]])
+
+    def design_matrix(df):
+        encoded = encoder.transform(categorical_values(df, columns["categorical"]))
+        encoded = encoded.toarray() if hasattr(encoded, "toarray") else encoded
+        values = numbers(df)
+        return np.hstack([encoded, scaler.transform(values[columns["scaled"]]),
+                          values[columns["passthrough"]].to_numpy(dtype = float)])
+
+    return {
+        "X" : design_matrix(training),
+        "y" : create_target_variable(training).astype("int8"),
+        "X_2023" : design_matrix(prediction),
+        "feature_names" : list(encoder.get_feature_names_out(columns["categorical"])) + numeric,
+        "transformers" : {"encoder" : encoder, "scaler" : scaler, "medians" : medians}}
+
+
+def materialise(training = None, prediction = None, store_dir = store_dir, columns = feature_columns):
+    """
+    Stores the features of the current source tables in `store_dir`/<version>, unless that version is already
+    stored: X.npy, y.npy and X_2023.npy, the fitted transformers (transformers.pkl) and meta.json with the
+    feature names. A version is written in a temporary directory and renamed, so it is never half written.
+
+    Args:
+        training: pd.DataFrame - Optional training songs. Defaults to preprocessing.training_data().
+        prediction: pd.DataFrame - Optional songs of 2023. Defaults to preprocessing.prediction_data().
+        store_dir: str - Directory of the feature store.
+        columns: dict - The columns of the design matrix, see `feature_columns`.
+
+    Returns:
+        str - The version of the features.
+    """
+    if training is None or prediction is None:
+        from preprocessing import training_data, prediction_data
+        training = training_data() if training is None else training
+        prediction = prediction_data() if prediction is None else prediction
+
+    version = data_version(training, prediction, columns)
+    path = os.path.join(store_dir, version)
+    if os.path.exists(path):
+        return version
+
+    features = build_features(training, prediction, columns)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    os.makedirs(tmp_path, exist_ok = True)
+    for name in ["X", "y", "X_2023"]:
+        np.save(os.path.join(tmp_path, f"{name}.npy"), features[name])
+    with open(os.path.join(tmp_path, "transformers.pkl"), "wb") as f:
+        pickle.dump(features["transformers"], f, protocol = pickle.HIGHEST_PROTOCOL)
+    with open(os.path.join(tmp_path, "meta.json"), "w") as f:
+        json.dump({
+            "version" : version,
+            "created" : datetime.now(timezone.utc).isoformat(timespec = "seconds"),
+            "columns" : columns,
+            "feature_names" : features["feature_names"],
+            "rows" : len(features["X"]),
+            "rows_2023" : len(features["X_2023"])}, f, indent = 1)
+    try:
+        os.replace(tmp_path, path)
+    except OSError:
+        # Another process stored the same version first
+        shutil.rmtree(tmp_path, ignore_errors = True)
+    return version
+
+
+def load_features(version = None, store_dir = store_dir):
+    """
+    Loads a version of the features. The arrays are memory-mapped read-only, so every training run, CV fold
+    and the scoring of 2023 share the same matrices without copying them.
+
+    Args:
+        version: str - The version to load. Defaults to the version of the current source tables, which is
+            stored first if needed (see `materialise`).
+        store_dir: str - Directory of the feature store.
+
+    Returns:
+        dict - "X", "y" and "X_2023" as read-only memory-mapped arrays, the "feature_names", the fitted
+        "transformers" and the "version".
+
+    Raises:
+        FileNotFoundError - If the version is not stored.
+
+    Example usage:
+    ```
+    features = load_features()
+    model.fit(features["X"], features["y"])
+    top_2023(model, features["X_2023"])
+    ```
+    """
+    version = version or materialise(store_dir = store_dir)
+    path = os.path.join(store_dir, version)
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"Version {version} of the features is not stored in /{store_dir}")
+    with open(os.path.join(path, "meta.json"), "r") as f:
+        meta = json.load(f)
+    with open(os.path.join(path, "transformers.pkl"), "rb") as f:
+        transformers = pickle.load(f)
+    features = {name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode = "r") for name in ["X", "y", "X_2023"]}
+    features.update({"feature_names" : meta["feature_names"], "transformers" : transformers, "version" : version})
+    return features
+
+
+def list_versions(store_dir = store_dir):
+    """
+    Returns the stored versions of the features, oldest first, with the date they were created and their rows.
+    """
+    if not os.path.exists(store_dir):
+        return pd.DataFrame(columns = ["version", "created", "rows", "rows_2023"])
+    metas = []
+    for version in os.listdir(store_dir):
+        meta_path = os.path.join(store_dir, version, "meta.json")
+        if os.path.exists(meta_path):
+            with open(meta_path, "r") as f:
+                meta = json.load(f)
+            metas.append({key: meta[key] for key in ["version", "created", "rows", "rows_2023"]})
+    return pd.DataFrame(metas, columns = ["version", "created", "rows", "rows_2023"]).sort_values("created", ignore_index = True)
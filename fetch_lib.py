@@ -0,0 +1,232 @@
+from urllib.request import Request, urlopen
+from urllib.error import HTTPError, URLError
+from urllib.parse import urlparse
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+import threading
+import hashlib
+import socket
+import json
+import time
+import os
+
+# Status codes worth retrying: throttling and server side failures
+retry_codes = {429, 500, 502, 503, 504}
+
+
+class HostRateLimiter:
+    """
+    Spaces out requests so that a single host never gets more than `rate` requests per second,
+    no matter how many worker threads are fetching at the same time.
+
+    Args:
+        - rate: Maximum number of requests per second and host. 0 or None disables the limit.
+    """
+
+    def __init__(self, rate = 5):
+        self.interval = 1 / rate if rate else 0
+        self.lock = threading.Lock()
+        self.next_slot = {}
+
+    def wait(self, host):
+        """
+        Blocks the calling thread until `host` can be requested again.
+        """
+        with self.lock:
+            now = time.monotonic()
+            slot = max(now, self.next_slot.get(host, now))
+            self.next_slot[host] = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+class PageCache:
+    """
+    Content-addressed on-disk cache of raw pages.
+
+    Bodies are stored once under `<cache_dir>/objects/<sha256>` and `<cache_dir>/index.json` maps
+    every url to the hash of its body plus the ETag/Last-Modified validators sent by the server,
+    so that cached pages can be revalidated with conditional requests.
+
+    Args:
+        - cache_dir: Directory where the cache lives. It is created if it does not exist.
+    """
+
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+        self.index_path = os.path.join(cache_dir, "index.json")
+        self.lock = threading.Lock()
+        os.makedirs(os.path.join(cache_dir, "objects"), exist_ok = True)
+        if os.path.exists(self.index_path):
+            with open(self.index_path, "r") as f:
+                self.index = json.load(f)
+        else:
+            self.index = {}
+
+    def object_path(self, sha256):
+        return os.path.join(self.cache_dir, "objects", sha256)
+
+    def lookup(self, url):
+        """
+        Returns the index entry of `url` or None if the url (or its body) is not cached.
+        """
+        entry = self.index.get(url)
+        if entry is None or not os.path.exists(self.object_path(entry["sha256"])):
+            return None
+        return entry
+
+    def read(self, url):
+        """
+        Returns the cached body of `url` as bytes.
+        """
+        with open(self.object_path(self.index[url]["sha256"]), "rb") as f:
+            return f.read()
+
+    def store(self, url, raw_web, etag = None, last_modified = None):
+        """
+        Stores the body of `url` together with its validators and returns its sha256.
+        """
+        sha256 = hashlib.sha256(raw_web).hexdigest()
+        path = self.object_path(sha256)
+        if not os.path.exists(path):
+            tmp_path = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(raw_web)
+            os.replace(tmp_path, path)
+
+        with self.lock:
+            self.index[url] = {
+                "sha256" : sha256,
+                "etag" : etag,
+                "last_modified" : last_modified,
+                "fetched" : datetime.now(timezone.utc).isoformat(timespec = "seconds")}
+            tmp_path = self.index_path + ".tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(self.index, f, indent = 1)
+            os.replace(tmp_path, self.index_path)
+        return sha256
+
+
+def fetch_url(url, headers, limiter, retries = 3, backoff = 1, timeout = 10, cache = None, offline = False):
+    """
+    Downloads a single url, retrying with exponential backoff on network errors and on
+    throttling/server errors.
+
+    If a `cache` is given, cached pages are revalidated with If-None-Match/If-Modified-Since and
+    served from disk when the server answers 304 Not Modified. With `offline = True` the network
+    is never touched and only cached pages are returned.
+
+    Args:
+        - url: The url to download.
+        - headers: A dictionary with the headers to use when sending the request.
+        - limiter: HostRateLimiter shared by every thread fetching from the same hosts.
+        - retries: Number of retries after the first attempt.
+        - backoff: Seconds to wait before the first retry. Doubles on every retry.
+        - timeout: Timeout in seconds of every single attempt.
+        - cache: Optional PageCache to read from and store into.
+        - offline: If True, serve only from `cache`.
+
+    Returns:
+        A tuple (raw_web, attempts, source) with the body of the response as bytes, the number
+        of network attempts it took and where the body came from: "network", "revalidated"
+        (304 from the server) or "cache" (offline).
+
+    Raises:
+        - KeyError: If `offline` is True and the url is not cached.
+        - urllib.error.HTTPError: If the server answers with a status that is not worth retrying
+          or retries run out.
+        - urllib.error.URLError / OSError: If the network keeps failing after every retry.
+    """
+    cached = cache.lookup(url) if cache is not None else None
+    if offline:
+        if cached is None:
+            raise KeyError(f"{url} is not cached")
+        return cache.read(url), 0, "cache"
+
+    headers = dict(headers)
+    if cached is not None:
+        if cached["etag"]:
+            headers["If-None-Match"] = cached["etag"]
+        if cached["last_modified"]:
+            headers["If-Modified-Since"] = cached["last_modified"]
+
+    host = urlparse(url).netloc
+    for attempt in range(retries + 1):
+        limiter.wait(host)
+        try:
+            req = Request(url, headers = headers)
+            response = urlopen(req, timeout = timeout)
+            raw_web = response.read()
+            if cache is not None:
+                cache.store(url, raw_web, response.headers.get("ETag"), response.headers.get("Last-Modified"))
+            return raw_web, attempt + 1, "network"
+        except HTTPError as e:
+            if e.code == 304 and cached is not None:
+                return cache.read(url), attempt + 1, "revalidated"
+            if e.code not in retry_codes or attempt == retries:
+                raise
+        except (URLError, socket.timeout, ConnectionError):
+            if attempt == retries:
+                raise
+        time.sleep(backoff * 2 ** attempt)
+
+
+def fetch_pages(urls, headers, max_workers = 8, rate = 5, retries = 3, backoff = 1, timeout = 10,
+                cache = None, offline = False):
+    """
+    Downloads several urls concurrently with a bounded thread pool.
+
+    Args:
+        - urls: Dictionary mapping a key (e.g. the year) to the url to download.
+        - headers: A dictionary with the headers to use when sending the requests.
+        - max_workers: Maximum number of requests in flight at the same time.
+        - rate: Maximum number of requests per second and host.
+        - retries: Number of retries per url, see `fetch_url`.
+        - backoff: Seconds to wait before the first retry, see `fetch_url`.
+        - timeout: Timeout in seconds of every single attempt.
+        - cache: Optional PageCache, see `fetch_url`.
+        - offline: If True, serve only from `cache`, see `fetch_url`.
+
+    Returns:
+        A tuple (pages, report):
+            - pages: Dictionary with the keys that could be downloaded and their raw body as bytes.
+            - report: Dictionary with every key and a dictionary with its "status" ("ok" or "error"),
+              the "seconds" it took and either the number of "attempts" and the "source" of the page
+              or the "error" message.
+    """
+    limiter = HostRateLimiter(rate)
+
+    def worker(key, url):
+        start = time.perf_counter()
+        try:
+            raw_web, attempts, source = fetch_url(url, headers, limiter, retries, backoff, timeout,
+                                                  cache, offline)
+            result = {"status" : "ok", "attempts" : attempts, "source" : source}
+        except Exception as e:
+            raw_web = None
+            result = {"status" : "error", "error" : repr(e)}
+        result["seconds"] = round(time.perf_counter() - start, 3)
+        return key, raw_web, result
+
+    pages = {}
+    report = {}
+    with ThreadPoolExecutor(max_workers = max_workers) as executor:
+        futures = [executor.submit(worker, key, url) for key, url in urls.items()]
+        for future in futures:
+            key, raw_web, result = future.result()
+            report[key] = result
+            if raw_web is not None:
+                pages[key] = raw_web
+
+    return pages, report
+
+
+def print_report(report):
+    """
+    Prints a one line summary of a `fetch_pages` report plus a line for every failed key.
+    """
+    failed = {k: v for k, v in report.items() if v["status"] != "ok"}
+    from_disk = len([v for v in report.values() if v.get("source") in ("cache", "revalidated")])
+    print(f"Fetched {len(report) - len(failed)}/{len(report)} pages ({from_disk} from cache).")
+    for key, result in failed.items():
+        print(f"    {key}: {result['error']}")
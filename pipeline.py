@@ -0,0 +1,175 @@
+import glob
+import hashlib
+import inspect
+import os
+import pickle
+import types
+from storage import file_sha256
+
+cache_dir = "cache/pipeline"
+# Directory of the modules of the repository, whose source is part of the keys of the stages
+code_dir = os.path.dirname(os.path.abspath(__file__))
+
+# Registered stages by name, see `register`
+stages = {}
+# Results computed in this process by stage name, as (key, value)
+results = {}
+
+
+def register(name, func, deps = (), files = (), persist = True):
+    """
+    Registers a stage of the pipeline.
+
+    A stage is a function whose arguments are the results of other stages (`deps`), passed by name.
+    Its result is memoised by a key that hashes the source code of the function and of the modules
+    of the repository it uses (see `code_hash`), the contents of the files it reads and the keys of
+    its dependencies, so it is only computed again when one of them changes.
+
+    Args:
+        name: str - Name of the stage, e.g. "canciones_overview".
+        func: function - Function computing the stage. It is called as func(**{dep: result of dep}).
+        deps: list - Names of the stages whose results are the arguments of `func`.
+        files: list - Paths or glob patterns of the files read by `func`.
+        persist: bool - If True the result is also memoised on disk (pickled in `cache_dir`), if False
+            only in memory, e.g. for results of SQL queries whose inputs can not be hashed.
+
+    Returns:
+        function - `func`, unchanged.
+    """
+    stages[name] = {"func" : func, "deps" : list(deps), "files" : list(files), "persist" : persist}
+    return func
+
+
+def files_hash(patterns):
+    """
+    Returns a hash of the names and contents of the files matching a list of paths or glob patterns.
+    """
+    sha256 = hashlib.sha256()
+    for path in sorted({path for pattern in patterns for path in glob.glob(pattern)}):
+        if os.path.isfile(path):
+            sha256.update(path.replace("\\", "/").encode())
+            sha256.update(file_sha256(path).encode())
+    return sha256.hexdigest()
+
+
+def local_modules(module):
+    """
+    Returns the modules of the repository a module uses, itself included: the ones it imports and
+    the ones of the functions and classes it imports, and so on recursively.
+    """
+    found = {}
+    pending = [module]
+    while pending:
+        module = pending.pop()
+        path = getattr(module, "__file__", None)
+        if module is None or module.__name__ in found or path is None \
+                or os.path.dirname(os.path.abspath(path)) != code_dir:
+            continue
+        found[module.__name__] = module
+        for value in list(vars(module).values()):
+            pending.append(value if isinstance(value, types.ModuleType) else inspect.getmodule(value))
+    return list(found.values())
+
+
+def code_hash(func):
+    """
+    Returns a hash of the source of a function and of the modules of the repository it uses (see
+    `local_modules`), so that changing a helper it calls, e.g. transforming.normalise_columns or
+    schema.downcast, also changes the key of the stage.
+    """
+    sha256 = hashlib.sha256(inspect.getsource(func).encode())
+    modules = local_modules(inspect.getmodule(func))
+    for module in sorted(modules, key = lambda module: module.__name__):
+        sha256.update(module.__name__.encode())
+        sha256.update(file_sha256(module.__file__).encode())
+    return sha256.hexdigest()
+
+
+def stage_key(name):
+    """
+    Returns the key of the current inputs of a stage: a hash of its code (see `code_hash`), its
+    files and the keys of its dependencies. The result is not computed.
+    """
+    stage = stages[name]
+    sha256 = hashlib.sha256(name.encode())
+    sha256.update(code_hash(stage["func"]).encode())
+    sha256.update(files_hash(stage["files"]).encode())
+    for dep in stage["deps"]:
+        sha256.update(stage_key(dep).encode())
+    return sha256.hexdigest()[:16]
+
+
+def cache_path(name, key, cache_dir = cache_dir):
+    return os.path.join(cache_dir, f"{name}-{key}.pkl")
+
+
+def get(name, force = False, cache_dir = cache_dir):
+    """
+    Returns the result of a stage, computing only the stages whose inputs changed.
+
+    Results are looked up in memory, then on disk and only computed (after their dependencies)
+    when neither has the current key. Results on disk of older keys of the stage are removed.
+    The result is shared by every caller, copy it before modifying it.
+
+    Args:
+        name: str - Name of the stage.
+        force: bool - If True the stage is computed again even if its result is memoised.
+            Its dependencies are still taken from the memo.
+        cache_dir: str - Directory of the results on disk.
+
+    Returns:
+        The result of the stage.
+
+    Example usage:
+    ```
+    import transforming
+    canciones_overview = pipeline.get("canciones_overview")
+    ```
+    """
+    stage = stages[name]
+    key = stage_key(name)
+    if not force and name in results and results[name][0] == key:
+        return results[name][1]
+
+    path = cache_path(name, key, cache_dir)
+    if stage["persist"] and not force and os.path.exists(path):
+        with open(path, "rb") as f:
+            value = pickle.load(f)
+    else:
+        value = stage["func"](**{dep: get(dep, cache_dir = cache_dir) for dep in stage["deps"]})
+        if stage["persist"]:
+            os.makedirs(cache_dir, exist_ok = True)
+            for old_path in glob.glob(cache_path(name, "*", cache_dir)):
+                os.remove(old_path)
+            with open(path + ".tmp", "wb") as f:
+                pickle.dump(value, f, protocol = pickle.HIGHEST_PROTOCOL)
+            os.replace(path + ".tmp", path)
+
+    results[name] = (key, value)
+    return value
+
+
+def invalidate(name = None, cache_dir = cache_dir):
+    """
+    Forgets the memoised results of a stage, or of every stage if `name` is None, in memory and on disk.
+    """
+    names = list(stages) if name is None else [name]
+    for stage_name in names:
+        results.pop(stage_name, None)
+        for path in glob.glob(cache_path(stage_name, "*", cache_dir)):
+            os.remove(path)
+
+
+def status(cache_dir = cache_dir):
+    """
+    Prints every registered stage, its dependencies and whether its result is memoised for its current inputs.
+    """
+    for name, stage in stages.items():
+        key = stage_key(name)
+        if name in results and results[name][0] == key:
+            state = "in memory"
+        elif stage["persist"] and os.path.exists(cache_path(name, key, cache_dir)):
+            state = "on disk"
+        else:
+            state = "stale"
+        print(f"{name:<22} {state:<10} <- {', '.join(stage['deps']) or '-'}")
@@ -5,37 +5,111 @@
 
 
 import pandas as pd
-from ydata_profiling import ProfileReport
 import numpy as np
+import importlib
 import random
 import json
 import os
+import warnings
 from sqlalchemy import create_engine
 from sqlalchemy.orm import Session
-import matplotlib as mpl
-import matplotlib.pyplot as plt
-import seaborn as sns
-from sklearn.preprocessing import OneHotEncoder, StandardScaler
-from sklearn.model_selection import train_test_split
-from sklearn.linear_model import LogisticRegression
-from sklearn.model_selection import  cross_val_score
-from sklearn.metrics import precision_score, recall_score, f1_score, accuracy_score
-from mlxtend.plotting import plot_confusion_matrix
-import warnings
 warnings.filterwarnings("ignore")
-from sql_lib import sql
-from imblearn.over_sampling import SMOTE
-from sklearn.utils import resample
-from sklearn.ensemble import RandomForestClassifier
-import tensorflow as tf
-from tensorflow.keras import regularizers
-
-training_raw = sql("""
+from sql_lib import get_query_cache, sql
+import pipeline
+
+# Heavy libraries are only imported when they are first used, so importing this module is fast and needs
+# no database. `preprocessing.tf`, `from preprocessing import SMOTE`... still work and import them then.
+lazy_imports = {
+    "ProfileReport" : ("ydata_profiling", "ProfileReport"),
+    "mpl" : ("matplotlib", None),
+    "plt" : ("matplotlib.pyplot", None),
+    "sns" : ("seaborn", None),
+    "OneHotEncoder" : ("sklearn.preprocessing", "OneHotEncoder"),
+    "StandardScaler" : ("sklearn.preprocessing", "StandardScaler"),
+    "train_test_split" : ("sklearn.model_selection", "train_test_split"),
+    "cross_val_score" : ("sklearn.model_selection", "cross_val_score"),
+    "LogisticRegression" : ("sklearn.linear_model", "LogisticRegression"),
+    "RandomForestClassifier" : ("sklearn.ensemble", "RandomForestClassifier"),
+    "resample" : ("sklearn.utils", "resample"),
+    "precision_score" : ("sklearn.metrics", "precision_score"),
+    "recall_score" : ("sklearn.metrics", "recall_score"),
+    "f1_score" : ("sklearn.metrics", "f1_score"),
+    "accuracy_score" : ("sklearn.metrics", "accuracy_score"),
+    "plot_confusion_matrix" : ("mlxtend.plotting", "plot_confusion_matrix"),
+    "SMOTE" : ("imblearn.over_sampling", "SMOTE"),
+    "tf" : ("tensorflow", None),
+    "regularizers" : ("tensorflow.keras", "regularizers")}
+
+def lazy_import(name):
+    """
+    Imports one of the `lazy_imports` and keeps it as an attribute of the module.
+    """
+    module_name, attribute = lazy_imports[name]
+    value = importlib.import_module(module_name)
+    if attribute is not None:
+        value = getattr(value, attribute)
+    globals()[name] = value
+    return value
+
+def load_training_raw():
+    """
+    Returns the songs from 2009 onwards with their features and overview, from the SQL database.
+    """
+    return sql("""
     SELECT * FROM canciones_features
     LEFT JOIN canciones_overview ON
-    canciones_overview.id = canciones_features.id
-    """) 
-prediction_raw = sql("SELECT * FROM canciones_2023")
+    canciones_overview.id_num = canciones_features.id_num
+    """)
+
+def load_prediction_raw():
+    """
+    Returns the songs of 2023 from the SQL database.
+    """
+    return sql("SELECT * FROM canciones_2023")
+
+# The database can change without the pipeline knowing, so these stages are only memoised in memory
+pipeline.register("training_raw", load_training_raw, persist = False)
+pipeline.register("prediction_raw", load_prediction_raw, persist = False)
+
+def training_data(refresh = False):
+    """
+    Returns the training songs (see `load_training_raw`), queried once per session.
+
+    Args:
+    - refresh (bool): If True the database is queried again.
+
+    Returns:
+    - pd.DataFrame: The songs from 2009 onwards. It is shared, copy it before modifying it.
+    """
+    if refresh:
+        # The query cache of sql_lib only knows about the writes made through sql_lib
+        get_query_cache().invalidate(["canciones_features", "canciones_overview"])
+    return pipeline.get("training_raw", force = refresh)
+
+def prediction_data(refresh = False):
+    """
+    Returns the songs of 2023 (see `load_prediction_raw`), queried once per session.
+
+    Args:
+    - refresh (bool): If True the database is queried again.
+
+    Returns:
+    - pd.DataFrame: The songs of 2023. It is shared, copy it before modifying it.
+    """
+    if refresh:
+        get_query_cache().invalidate(["canciones_2023"])
+    return pipeline.get("prediction_raw", force = refresh)
+
+def __getattr__(name):
+    """
+    Keeps `preprocessing.training_raw` and `preprocessing.prediction_raw` working, queried on first use,
+    and imports the `lazy_imports` on first use.
+    """
+    if name in ["training_raw", "prediction_raw"]:
+        return pipeline.get(name)
+    if name in lazy_imports:
+        return lazy_import(name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 def create_target_variable(df):
     """
@@ -77,7 +151,9 @@ def statistics(model, X_test, y_test):
     None
     """
 
-    from sklearn.metrics import confusion_matrix
+    from sklearn.metrics import confusion_matrix, accuracy_score, precision_score, recall_score, f1_score
+    from mlxtend.plotting import plot_confusion_matrix
+    import matplotlib.pyplot as plt
     y_pred = model.predict(X_test)
     confusion_matrix = confusion_matrix(y_test, y_pred)
 
@@ -111,7 +187,7 @@ def top_2023(model, data_2023):
 
     prediccion_m1_2023= model.predict(data_2023)
 
-    paises= sql("""SELECT country FROM canciones_2023""")
+    paises= prediction_data()[["country"]].reset_index(drop = True)
 
     top = pd.concat([paises, pd.DataFrame(prediccion_m1_2023)], axis=1)
     print(f"Model predicts {len(top[top[0] == 1])} countries will make it in the top five")
@@ -130,8 +206,9 @@ def nn_statistics(model, X_test, y_test):
     None
     """
     
-    from sklearn.metrics import confusion_matrix
-
+    from sklearn.metrics import confusion_matrix, accuracy_score, precision_score, recall_score, f1_score
+    from mlxtend.plotting import plot_confusion_matrix
+    import matplotlib.pyplot as plt
 
     y_pred = model.predict(X_test).flatten()
     y_pred = [np.round(i).astype(int) for i in y_pred]
@@ -151,4 +228,9 @@ def nn_statistics(model, X_test, y_test):
 
     f1 = f1_score(y_test, y_pred)
     print('F1 score: %f' % f1)
- 
\ No newline at end of file
+ 
+
+# Names exported by `from preprocessing import *`, as the notebooks use it: every public name of the module,
+# the `lazy_imports` and the training and prediction data. A star import therefore imports the heavy
+# libraries and queries the database, as this module did before they were lazy; `import preprocessing` does not.
+__all__ = [name for name in list(globals()) if not name.startswith("_")] + list(lazy_imports) + ["training_raw", "prediction_raw"]
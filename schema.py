@@ -0,0 +1,202 @@
+import pandas as pd
+
+# Declared dtypes of the cleaned tables. Columns not listed keep their dtype, except in tables
+# with a "*" entry, where it is the dtype of every other column (the voting countries).
+schemas = {
+    "puntos_por_anho" : {
+        "Country" : "category",
+        "Contestants" : "category",
+        "Year" : "int16",
+        "Total score" : "int16",
+        "Jury score" : "int16",
+        "Televoting score" : "int16",
+        "*" : "int8"},
+    "canciones_por_anho" : {
+        "Country" : "category",
+        "Language" : "category",
+        "Points" : "int16",
+        "Order" : "int8",
+        "Year" : "int16"},
+    "songs_cleaned" : {
+        "year" : "int16",
+        "semi_draw_position" : "int8",
+        "final_draw_position" : "int8",
+        "country" : "category",
+        "language" : "category",
+        "style" : "category",
+        "gender" : "category",
+        "main_singers" : "int8",
+        "key" : "category",
+        "BPM" : "int16",
+        "energy" : "int8",
+        "danceability" : "int8",
+        "happiness" : "int8",
+        "loudness" : "int8",
+        "liveness" : "int8",
+        "speechiness" : "int8",
+        "backing_dancers" : "int8",
+        "backing_singers" : "int8",
+        "backing_instruments" : "int8",
+        "instrument_10" : "int8",
+        "final_televote_points" : "int16",
+        "final_jury_points" : "int16",
+        "final_place" : "int8",
+        "favourite_10" : "int8",
+        "host_10" : "int8"},
+}
+
+
+def apply_schema(df, name):
+    """
+    Casts the columns of a cleaned table to the dtypes declared in `schemas`, turns the values of
+    the other object columns into text and drops index columns that leaked in from csv files ("Unnamed: 0").
+
+    Args:
+        df: pd.DataFrame - The table to cast.
+        name: str - The name of the table in `schemas`.
+
+    Returns:
+        pd.DataFrame - A new DataFrame with the declared dtypes.
+
+    Raises:
+        ValueError/TypeError - If a column can not be cast to its declared dtype.
+    """
+    schema = schemas[name]
+    df = df.drop(columns = [col for col in df.columns if col.startswith("Unnamed:")])
+    dtypes = {}
+    for col in df.columns:
+        dtype = schema.get(col, schema.get("*"))
+        if dtype is not None:
+            dtypes[col] = dtype
+        elif df[col].dtype == object:
+            # Text columns can hold numbers read from Excel (e.g. a song called 22), store them all as text
+            df[col] = df[col].where(df[col].isna(), df[col].astype(str))
+    return df.astype(dtypes)
+
+
+def memory_mb(df):
+    """
+    Returns the memory used by a DataFrame in MB, including the contents of object columns.
+    """
+    return df.memory_usage(deep = True).sum() / 1024 ** 2
+
+
+def report_memory(step, before, after):
+    """
+    Prints the memory used by a table before and after a step.
+    """
+    print(f"{step}: {before:.3f} MB -> {after:.3f} MB")
+
+
+def floats_to_int(df, columns = None):
+    """
+    Rounds float columns to the nearest integer and casts them to int64, all at once per column.
+    Columns with missing values are left as floats.
+
+    Args:
+        df: pd.DataFrame - The table to transform. It is modified in place.
+        columns: list - Optional columns to convert. Defaults to every float column.
+
+    Returns:
+        pd.DataFrame - The same DataFrame.
+    """
+    columns = df.select_dtypes("float").columns if columns is None else columns
+    for col in columns:
+        if not df[col].isna().any():
+            df[col] = df[col].round().astype("int64")
+    return df
+
+
+def parse_loudness(loudness):
+    """
+    Converts loudness values like '-11 dB', '4.5' or 6 into negative numbers rounded to the
+    nearest integer, with vectorised string operations.
+
+    Args:
+        loudness: pd.Series - The loudness values.
+
+    Returns:
+        pd.Series - The converted loudness values as floats.
+    """
+    text = loudness.where(loudness.isna(), loudness.astype(str))
+    loudness = pd.to_numeric(text.str.split(" ", n = 1).str[0])
+    return loudness.where(loudness <= 0, -loudness).round()
+
+
+def integral_float_columns(df):
+    """
+    Returns the float columns without missing values or decimals, the ones `floats_to_int` converts without loss.
+    """
+    return [col for col in df.select_dtypes("float").columns
+            if not df[col].isna().any() and (df[col] % 1 == 0).all()]
+
+
+def downcast_integers(df):
+    """
+    Returns a copy of a table with every integer column cast to the smallest integer type that holds its values.
+    """
+    df = df.copy()
+    for col in df.select_dtypes("integer").columns:
+        df[col] = pd.to_numeric(df[col], downcast = "integer")
+    return df
+
+
+def to_categoricals(df, categorical_ratio = 0.5):
+    """
+    Returns a copy of a table with the text columns with few distinct values (less than `categorical_ratio`
+    of the rows) turned into categoricals.
+    """
+    df = df.copy()
+    for col in df.columns:
+        column = df[col]
+        if column.dtype == object and len(column) and column.nunique() < categorical_ratio * len(column):
+            df[col] = column.astype("category")
+    return df
+
+
+def downcast(df, categorical_ratio = 0.5):
+    """
+    Casts every column of a table to the smallest dtype that holds all its values:
+    floats without decimals or missing values to integers (see `floats_to_int`), integers to the smallest
+    integer type and text columns with few distinct values (less than `categorical_ratio` of the rows)
+    to categoricals. Float columns with decimals are left as they are so no precision is lost.
+
+    Args:
+        df: pd.DataFrame - The table to downcast.
+        categorical_ratio: float - Maximum share of distinct values of a text column turned into a categorical.
+
+    Returns:
+        pd.DataFrame - A new, downcast DataFrame.
+    """
+    df = floats_to_int(df.copy(), integral_float_columns(df))
+    return to_categoricals(downcast_integers(df), categorical_ratio)
+
+
+def compact(df, name, schema = None, categorical_ratio = 0.5):
+    """
+    Compacts a table step by step, reporting its memory (`memory_usage(deep = True)`) before and after each
+    step: the declared dtypes of `schema` (see `apply_schema`), if given, then floats without decimals to
+    integers (see `floats_to_int`), integers to their smallest type and text columns to categoricals
+    (see `downcast`).
+
+    Args:
+        df: pd.DataFrame - The table to compact.
+        name: str - Name of the table, used in the report.
+        schema: str - Optional name of the table in `schemas`.
+        categorical_ratio: float - See `downcast`.
+
+    Returns:
+        pd.DataFrame - The compacted DataFrame.
+    """
+    steps = [
+        ("floats_to_int", lambda df: floats_to_int(df.copy(), integral_float_columns(df))),
+        ("downcast", downcast_integers),
+        ("categoricals", lambda df: to_categoricals(df, categorical_ratio))]
+    if schema is not None:
+        steps.insert(0, ("apply_schema", lambda df: apply_schema(df, schema)))
+
+    for step, func in steps:
+        before = memory_mb(df)
+        df = func(df)
+        report_memory(f"{name} {step}", before, memory_mb(df))
+    return df
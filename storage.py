@@ -0,0 +1,208 @@
+import os
+import re
+import hashlib
+import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
+import pyarrow.feather as feather
+from schema import apply_schema
+
+cleaned_dir = "cleaned_data"
+excel_cache_dir = "cache/excel"
+
+
+def cleaned_path(folder, filename, extension = ".parquet"):
+    """
+    Returns the path of a cleaned file, e.g. cleaned_path("puntos_por_anho", "1957.csv")
+    is "cleaned_data/puntos_por_anho/1957.parquet". An empty folder refers to "cleaned_data" itself.
+    """
+    stem = os.path.splitext(filename)[0]
+    return os.path.join(cleaned_dir, folder, stem + extension)
+
+
+def write_cleaned(df, folder, filename, schema):
+    """
+    Stores a cleaned table as Parquet with the dtypes declared in schema.schemas.
+
+    Args:
+        df: pd.DataFrame - The cleaned table.
+        folder: str - Subdirectory of "cleaned_data", "" for the directory itself.
+        filename: str - Logical file name, e.g. "1957.csv". The extension is replaced by ".parquet".
+        schema: str - Name of the schema of the table, see schema.schemas.
+
+    Returns:
+        pd.DataFrame - The table with the declared dtypes, as it was stored.
+    """
+    df = apply_schema(df, schema)
+    df.to_parquet(cleaned_path(folder, filename), index = False)
+    return df
+
+
+def read_cleaned_file(folder, filename):
+    """
+    Reads a cleaned table, from its Parquet file when there is one and from the legacy
+    csv file otherwise.
+
+    Args:
+        folder: str - Subdirectory of "cleaned_data", "" for the directory itself.
+        filename: str - Logical file name, e.g. "1957.csv".
+
+    Returns:
+        pd.DataFrame - The cleaned table.
+    """
+    path = cleaned_path(folder, filename)
+    if os.path.exists(path):
+        return pd.read_parquet(path)
+    return pd.read_csv(cleaned_path(folder, filename, ".csv"))
+
+
+def list_cleaned(folder):
+    """
+    Returns the sorted logical file names ("<stem>.csv") of the cleaned tables in a
+    subdirectory of "cleaned_data", whether they are stored as Parquet or csv.
+    """
+    stems = {os.path.splitext(file)[0] for file in os.listdir(os.path.join(cleaned_dir, folder))
+             if file.endswith((".parquet", ".csv"))}
+    return sorted(stem + ".csv" for stem in stems)
+
+
+def file_year(filename):
+    """
+    Returns the year in a per year file name, e.g. 1957 for "1957.csv" or 2016 for "juryvote_2016.csv".
+    """
+    return int(re.search(r"\d{4}", filename).group(0))
+
+
+class YearDataset:
+    """
+    Lazy dataset over a per year directory of "cleaned_data", partitioned by year.
+
+    Creating the dataset only lists the directory. Files are opened when `read` is called, and only
+    those of the requested years, in parallel, and concatenated once.
+
+    Args:
+        folder: str - Subdirectory of "cleaned_data", e.g. "puntos_por_anho".
+        prefix: str - Prefix of the files of the dataset: "" for "<year>.csv" files, "juryvote"
+            for "juryvote_<year>.csv" files and so on.
+        frames: dict - Optional DataFrames already in memory, keyed by file name (e.g. the output of
+            cleaning.clean_all_data), used instead of reading those files.
+
+    Example usage:
+    ```
+    YearDataset("canciones_por_anho").read(years = range(2009, 2023))
+    ```
+    """
+
+    def __init__(self, folder, prefix = "", frames = None):
+        self.folder = folder
+        self.frames = frames or {}
+        pattern = re.compile(rf"^{prefix}_?\d{{4}}\.csv$" if prefix else r"^\d{4}\.csv$")
+        files = set(list_cleaned(folder)) | set(self.frames)
+        self.partitions = {file_year(file): file for file in sorted(files) if pattern.match(file)}
+
+    @property
+    def years(self):
+        """
+        The sorted years of the partitions.
+        """
+        return sorted(self.partitions)
+
+    def files(self, years = None):
+        """
+        Returns the file names of the partitions of `years` (all of them by default), sorted by year.
+        """
+        years = self.years if years is None else sorted(set(years) & set(self.partitions))
+        return [self.partitions[year] for year in years]
+
+    def read_partition(self, year, transform = None):
+        """
+        Reads the partition of a year, from memory when available, and applies
+        `transform(df, folder, year)` to it.
+        """
+        file = self.partitions[year]
+        df = self.frames[file] if file in self.frames else read_cleaned_file(self.folder, file)
+        return df if transform is None else transform(df, self.folder, year)
+
+    def read(self, years = None, transform = None, max_workers = 8):
+        """
+        Reads the partitions of `years` in parallel and concatenates them once.
+
+        Args:
+            years: iterable - Years to read, e.g. range(2009, 2023). Defaults to every partition.
+                Partitions of other years are not opened.
+            transform: function - Optional function `transform(df, folder, year)` applied to every
+                partition before concatenating, e.g. transforming.normalise_columns.
+            max_workers: int - Number of files read at the same time.
+
+        Returns:
+            pd.DataFrame - The concatenated partitions, in year order. Empty if no partition matches.
+        """
+        years = [file_year(file) for file in self.files(years)]
+        if not years:
+            return pd.DataFrame()
+        with ThreadPoolExecutor(max_workers = max_workers) as executor:
+            frames = list(executor.map(lambda year: self.read_partition(year, transform), years))
+        return pd.concat(frames, axis = 0)
+
+
+def file_sha256(path):
+    """
+    Returns the sha256 of the contents of a file.
+    """
+    sha256 = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            sha256.update(block)
+    return sha256.hexdigest()
+
+
+def restore_mixed(value):
+    """
+    Turns a value of a mixed type column, stored as text, back into a number when it is one.
+    """
+    if value is None:
+        return float("nan")
+    for cast in (int, float):
+        try:
+            return cast(value)
+        except ValueError:
+            pass
+    return value
+
+
+def read_excel_cached(path, cache_dir = excel_cache_dir):
+    """
+    Reads an Excel file through an Arrow IPC (Feather) cache keyed by the hash of the file.
+
+    The first read parses the Excel file and stores it uncompressed in
+    `cache_dir`/<name>-<sha256>.arrow. Later reads of the same file memory-map the cache,
+    which is close to zero-copy. Columns mixing text and numbers, which Arrow can not store,
+    are stored as text and turned back into numbers when read.
+
+    Args:
+        path: str - Path of the Excel file.
+        cache_dir: str - Directory of the cache.
+
+    Returns:
+        pd.DataFrame - The contents of the first sheet, as pd.read_excel would return them.
+    """
+    name = os.path.splitext(os.path.basename(path))[0]
+    cache_path = os.path.join(cache_dir, f"{name}-{file_sha256(path)}.arrow")
+
+    if not os.path.exists(cache_path):
+        df = pd.read_excel(path)
+        mixed = [col for col in df.columns
+                 if df[col].dtype == object and df[col].dropna().map(type).nunique() > 1]
+        for col in mixed:
+            df[col] = df[col].map(lambda x: x if pd.isna(x) else str(x))
+        os.makedirs(cache_dir, exist_ok = True)
+        with open(cache_path + ".mixed", "w") as f:
+            f.write("\n".join(mixed))
+        feather.write_feather(df, cache_path + ".tmp", compression = "uncompressed")
+        os.replace(cache_path + ".tmp", cache_path)
+
+    df = feather.read_table(cache_path, memory_map = True).to_pandas()
+    with open(cache_path + ".mixed", "r") as f:
+        mixed = [col for col in f.read().split("\n") if col]
+    for col in mixed:
+        df[col] = df[col].map(restore_mixed)
+    return df
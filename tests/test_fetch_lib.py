@@ -0,0 +1,114 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.error import HTTPError
+import pytest
+from fetch_lib import HostRateLimiter, PageCache, fetch_pages, fetch_url
+
+
+class SavedPages(BaseHTTPRequestHandler):
+    """
+    Local stand-in for Wikipedia serving saved pages:
+        - /page/<name>: a page, always available.
+        - /flaky: fails with 503 on the first two requests.
+        - /missing: 404.
+        - /etag: a page with an ETag, 304 when the request sends it back.
+    """
+    requests = []
+    flaky_failures = 2
+
+    def do_GET(self):
+        type(self).requests.append((self.path, dict(self.headers)))
+        if self.path.startswith("/page/"):
+            self.send_page(f"<html>{self.path[6:]}</html>".encode())
+        elif self.path == "/flaky":
+            if type(self).flaky_failures > 0:
+                type(self).flaky_failures -= 1
+                self.send_error(503)
+            else:
+                self.send_page(b"<html>flaky</html>")
+        elif self.path == "/etag":
+            if self.headers.get("If-None-Match") == '"v1"':
+                self.send_response(304)
+                self.end_headers()
+            else:
+                self.send_page(b"<html>etag</html>", {"ETag" : '"v1"'})
+        else:
+            self.send_error(404)
+
+    def send_page(self, body, headers = None):
+        self.send_response(200)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    SavedPages.requests = []
+    SavedPages.flaky_failures = 2
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), SavedPages)
+    thread = threading.Thread(target = httpd.serve_forever, daemon = True)
+    thread.start()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}"
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_retries_server_errors_with_backoff(server):
+    raw_web, attempts, source = fetch_url(f"{server}/flaky", {}, HostRateLimiter(None), retries = 3, backoff = 0.01)
+    assert raw_web == b"<html>flaky</html>"
+    assert attempts == 3
+    assert source == "network"
+
+
+def test_gives_up_when_retries_run_out(server):
+    with pytest.raises(HTTPError) as error:
+        fetch_url(f"{server}/flaky", {}, HostRateLimiter(None), retries = 1, backoff = 0.01)
+    assert error.value.code == 503
+    assert len(SavedPages.requests) == 2
+
+
+def test_does_not_retry_not_found(server):
+    with pytest.raises(HTTPError) as error:
+        fetch_url(f"{server}/missing", {}, HostRateLimiter(None), retries = 3, backoff = 0.01)
+    assert error.value.code == 404
+    assert len(SavedPages.requests) == 1
+
+
+def test_fetch_pages_reports_every_key(server):
+    urls = {year: f"{server}/page/{year}" for year in range(1957, 1967)}
+    urls[1967] = f"{server}/missing"
+    pages, report = fetch_pages(urls, {}, max_workers = 4, rate = None, retries = 0)
+    assert pages == {year: f"<html>{year}</html>".encode() for year in range(1957, 1967)}
+    assert report[1967]["status"] == "error"
+    assert all(report[year]["status"] == "ok" for year in range(1957, 1967))
+
+
+def test_revalidates_cached_pages(server, tmp_path):
+    cache = PageCache(str(tmp_path))
+    url = f"{server}/etag"
+    assert fetch_url(url, {}, HostRateLimiter(None), cache = cache)[2] == "network"
+    raw_web, attempts, source = fetch_url(url, {}, HostRateLimiter(None), cache = cache)
+    assert (raw_web, source) == (b"<html>etag</html>", "revalidated")
+    assert SavedPages.requests[-1][1].get("If-None-Match") == '"v1"'
+
+    # The index survives the process
+    assert PageCache(str(tmp_path)).lookup(url)["etag"] == '"v1"'
+
+
+def test_offline_serves_only_from_cache(server, tmp_path):
+    cache = PageCache(str(tmp_path))
+    urls = {1957 : f"{server}/page/1957", 1958 : f"{server}/page/1958"}
+    fetch_pages({1957 : urls[1957]}, {}, rate = None, cache = cache)
+    requests = len(SavedPages.requests)
+
+    pages, report = fetch_pages(urls, {}, rate = None, cache = cache, offline = True)
+    assert pages == {1957 : b"<html>1957</html>"}
+    assert report[1957]["source"] == "cache"
+    assert report[1958]["status"] == "error"
+    assert len(SavedPages.requests) == requests
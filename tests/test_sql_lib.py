@@ -0,0 +1,80 @@
+import pandas as pd
+import pytest
+from sqlalchemy import inspect
+import sql_lib
+from sql_lib import QueryCache, create_db_engine, create_summary, pd_df_to_sql_tables, sql, sql_many
+
+
+@pytest.fixture
+def engine(tmp_path):
+    """
+    A temporary SQLite database as the shared engine, with an empty query cache.
+    """
+    previous = sql_lib.engine, sql_lib.query_cache
+    engine = create_db_engine(dict(sql_lib.default_config, backend = "sqlite", path = str(tmp_path / "test.db")))
+    sql_lib.engine, sql_lib.query_cache = engine, QueryCache()
+    yield engine
+    engine.dispose()
+    sql_lib.engine, sql_lib.query_cache = previous
+
+
+def votes(points_2016 = 12):
+    return pd.DataFrame({
+        "year" : [2016, 2016, 2016, 2017, 2017],
+        "from_country" : ["Spain", "Italy", "Spain", "Spain", "Italy"],
+        "to_country" : ["Italy", "Spain", "Sweden", "Italy", "Spain"],
+        "source" : ["jury", "jury", "televote", "jury", "jury"],
+        "points" : [points_2016, 10, 8, 12, 10]})
+
+
+def test_load_creates_primary_key_and_indexes(engine):
+    df = pd.DataFrame({"id" : ["Spain2016", "Italy2016"], "year" : [2016, 2016], "country" : ["Spain", "Italy"]})
+    pd_df_to_sql_tables(df, "canciones_overview")
+    inspector = inspect(engine)
+    assert inspector.get_pk_constraint("canciones_overview")["constrained_columns"] == ["id"]
+    assert {index["name"] for index in inspector.get_indexes("canciones_overview")} == {
+        "ix_canciones_overview_year", "ix_canciones_overview_country"}
+    assert not inspector.has_table("canciones_overview__staging")
+
+    # Loading again replaces the table
+    pd_df_to_sql_tables(df.iloc[:1], "canciones_overview")
+    assert sql("SELECT COUNT(*) AS n FROM canciones_overview")["n"][0] == 1
+
+
+def test_cache_hits_and_invalidation_after_writes(engine):
+    pd_df_to_sql_tables(votes(), "votos")
+    cache = sql_lib.get_query_cache()
+    query = "SELECT SUM(points) AS points FROM votos WHERE year = :year"
+
+    assert sql(query, params = {"year" : 2016})["points"][0] == 30
+    assert (cache.hits, cache.misses) == (0, 0)
+    assert sql(query, params = {"year" : 2016}, cache = True)["points"][0] == 30
+    assert sql(query, params = {"year" : 2016}, cache = True)["points"][0] == 30
+    assert (cache.hits, cache.misses) == (1, 1)
+
+    sql("UPDATE votos SET points = 1 WHERE year = 2016")
+    assert sql(query, params = {"year" : 2016}, cache = True)["points"][0] == 3
+    pd_df_to_sql_tables(votes(), "votos")
+    assert sql(query, params = {"year" : 2016}, cache = True)["points"][0] == 30
+    assert cache.hits == 1
+
+
+def test_summaries_refresh_only_changed_years(engine):
+    pd_df_to_sql_tables(votes(), "votos")
+    create_summary("points_received", sql_lib.summary_queries["points_received"])
+    query = "SELECT points FROM points_received WHERE year = :year AND country = 'Italy' AND source = 'jury'"
+    assert sql(query, params = {"year" : 2016})["points"][0] == 12
+
+    # A marker in a year whose votes do not change survives the refresh, the changed year is computed again
+    sql("UPDATE points_received SET points = -1 WHERE year = 2017")
+    pd_df_to_sql_tables(votes(points_2016 = 1), "votos")
+    assert sql(query, params = {"year" : 2016})["points"][0] == 1
+    assert sql(query, params = {"year" : 2017})["points"][0] == -1
+
+
+def test_sql_many_keeps_the_order_of_the_queries(engine):
+    pd_df_to_sql_tables(votes(), "votos")
+    queries = [f"SELECT COUNT(*) AS n FROM votos WHERE year = {year}" for year in (2017, 2016, 2018)]
+    frames, report = sql_many(queries, limit = 2)
+    assert [df["n"][0] for df in frames] == [2, 3, 0]
+    assert [entry["query"] for entry in report] == queries
@@ -0,0 +1,35 @@
+import json
+import numpy as np
+import pandas as pd
+import pytest
+from transforming import create_key, encode_countries
+
+
+def test_encode_countries_keeps_codes_across_runs(tmp_path):
+    path = str(tmp_path / "country_index.json")
+    first = encode_countries(pd.Series(["Spain", "Italy", "Spain"]), path)
+    second = encode_countries(pd.Series(["Sweden", "Spain"]), path)
+    assert first.tolist() == [2, 1, 2]
+    assert second.tolist() == [3, 2]
+    with open(path, "r") as f:
+        assert json.load(f) == {"Italy" : 1, "Spain" : 2, "Sweden" : 3}
+
+
+def test_missing_countries_get_no_code(tmp_path):
+    path = str(tmp_path / "country_index.json")
+    encode_countries(pd.Series(["Spain"]), path)
+    with pytest.raises(ValueError):
+        encode_countries(pd.Series(["Italy", np.nan, None]), path)
+    with open(path, "r") as f:
+        assert json.load(f) == {"Spain" : 1}
+
+
+def test_create_key_rejects_rows_without_country(tmp_path):
+    df = pd.DataFrame({"country" : ["Spain", np.nan], "year" : [1990, 1991]})
+    with pytest.raises(ValueError):
+        create_key(df, path = str(tmp_path / "country_index.json"))
+    assert "id_num" not in df.columns
+
+    df = pd.DataFrame({"country" : ["Spain", "Italy"], "year" : [1990, 1991]})
+    create_key(df, path = str(tmp_path / "country_index.json"))
+    assert df["id_num"].tolist() == [1990002, 1991001]
@@ -0,0 +1,29 @@
+import pandas as pd
+import pytest
+from votes import VoteStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    jury = pd.DataFrame({"country" : ["Italy", "Spain"], "year" : [2016, 2016], "Spain" : [12, 0], "Italy" : [0, 10]})
+    tele = pd.DataFrame({"country" : ["Italy", "Spain"], "year" : [2016, 2016], "Spain" : [8, 0], "Italy" : [0, 12]})
+    combined = pd.DataFrame({"country" : ["Italy"], "year" : [2015], "Spain" : [6]})
+    return VoteStore.from_frames([(combined, "combined"), (jury, "jury"), (tele, "televote")],
+                                 str(tmp_path / "country_index.json"))
+
+
+def test_jury_and_televote_are_kept_apart(store):
+    received = store.received("Italy", years = [2016])
+    assert received[["source", "points"]].astype({"source" : str}).values.tolist() == [["jury", 12], ["televote", 8]]
+    assert store.received("Italy", source = "jury")["points"].tolist() == [12]
+    assert store.given("Italy", source = "televote")["points"].tolist() == [12]
+
+
+def test_sources_are_added_up_only_when_asked(store):
+    combined = store.received("Italy", combine = True)
+    assert combined[["year", "points"]].values.tolist() == [[2015, 6], [2016, 20]]
+    assert (combined["source"] == "combined").all()
+
+    assert store.matrix().loc[(2016, "Italy"), "Spain"] == 20
+    assert store.matrix("jury").loc[(2016, "Italy"), "Spain"] == 12
+    assert store.matrix("televote").loc[(2016, "Spain"), "Italy"] == 12
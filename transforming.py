@@ -4,47 +4,95 @@ import os
 import json
 from sqlalchemy import create_engine
 from sqlalchemy.orm import Session
+from storage import YearDataset, read_cleaned_file
+from concurrent.futures import ThreadPoolExecutor
+from schema import compact, floats_to_int
+import pipeline
+from entities import entities_path, resolve
 import warnings
 warnings.filterwarnings("ignore")
 
+country_index_path = "cleaned_data/country_index.json"
+
+
+# Column renames applied when the cleaned files are read, one entry per source layout and range
+# of years (both ends included, None for open ended ranges). Wikipedia notes like "[12]" or "(s)"
+# are stripped from the names before they are looked up. Source files are never rewritten.
+column_registry = [
+    {"layout" : "canciones_por_anho",
+     "years" : (1957, None),
+     "columns" : {
+        "Country" : "country",
+        "Artist" : "artist_name",
+        "Performer" : "artist_name",
+        "Song" : "song_name",
+        "Language" : "language",
+        "Place" : "final_place",
+        "Final result" : "final_place",
+        "Order" : "final_draw_position",
+        "Year" : "year"}},
+    {"layout" : "puntos_por_anho",
+     "years" : (1957, 2015),
+     "columns" : {
+        "Country" : "country",
+        "Year" : "year"}},
+    {"layout" : "puntos_por_anho",
+     "years" : (2016, None),
+     "columns" : {
+        "Contestants" : "country",
+        "Contestans" : "country",
+        "\ufeffContestants" : "country",
+        "Year" : "year"}},
+]
+
+def column_mapping(layout:str, year:int):
+    """
+    Returns the column renames registered for a layout and year in `column_registry`.
+
+    Parameters:
+    - layout: str - The per year directory the file comes from, "canciones_por_anho" or "puntos_por_anho".
+    - year: int - The year of the file.
 
-def fix_colnames(filename:str, path:str):
+    Returns:
+    - dict - The renames of the first matching entry, or an empty dict if no entry matches.
     """
-    Clean the column names of a CSV file located at the specified path by removing any characters within square brackets and parentheses
-    and renaming specific columns to more appropriate names. The cleaned CSV file is saved at the same location.
+    for entry in column_registry:
+        first, last = entry["years"]
+        if entry["layout"] == layout and first <= year and (last is None or year <= last):
+            return entry["columns"]
+    return {}
+
+def normalise_columns(df, layout:str, year:int):
+    """
+    Renames the columns of a cleaned file as registered in `column_registry` for its layout and year.
 
     Parameters:
-    - filename: str - The name of the CSV file to be cleaned.
-    - path: str - The path to the folder where the CSV file is located.
+    - df: pd.DataFrame - The DataFrame read from the file.
+    - layout: str - The per year directory the file comes from.
+    - year: int - The year of the file.
 
     Returns:
-    - None - The function does not return any value.
+    - pd.DataFrame - A DataFrame with the normalised column names.
 
     Example usage:
     ```
-    fix_colnames("my_file.csv", "/path/to/my/folder")
+    normalise_columns(pd.read_csv("cleaned_data/canciones_por_anho/2022.csv"), "canciones_por_anho", 2022)
     ```
     """
-    df = pd.read_csv(path + "/" + filename)
-    change_dict = {}
-    colnames = df.columns
-    for col in colnames:
-        new_col = col.split("[")[0]
-        new_col = new_col.split("(")[0]
-        if new_col == "Final result":
-            new_col = "Place"
-        elif new_col == "Performer":
-            new_col = "Artist"
-        change_dict[col] = new_col
-        df.rename(columns = change_dict, inplace = True)
-        df.to_csv(path + "/" +filename, index = False)
+    columns = column_mapping(layout, year)
+
+    def normalise(col):
+        col = col.split("[")[0].split("(")[0].strip()
+        return columns.get(col, col)
+
+    return df.rename(columns = normalise)
 
 
 def create_id(df,name = "id"):
     """
-    Create a unique identifier for each row in the input DataFrame by concatenating the first 4 characters of the "year" column
-    and the first 6 characters of the "country" column. The resulting IDs are inserted as a new column at the beginning of the
-    DataFrame.
+    Create a unique identifier for each row in the input DataFrame by concatenating the first 6 characters of the "country" column
+    and the first 4 characters of the "year" column, with vectorised string operations. The resulting IDs are inserted as a new
+    column at the beginning of the DataFrame.
 
     Parameters:
     - df: pd.DataFrame - The input DataFrame to which the IDs will be added.
@@ -58,17 +106,155 @@ def create_id(df,name = "id"):
     my_df_with_ids = create_id(my_df, "unique_id")
     ```
     """
-    canciones_id = []
-    for i in df.iterrows():
-        year = str(i[1]["year"])[:4]
-        country = i[1]["country"][ :6]
-        canciones_id.append(country + year)
+    canciones_id = df["country"].astype(str).str[:6] + df["year"].astype(str).str[:4]
     df.insert(0,name,canciones_id)
     return df
 
+def load_country_index(path:str = country_index_path):
+    """
+    Load the persistent dictionary that assigns a compact integer code to every country.
+
+    Parameters:
+    - path: str - The path of the JSON file with the index.
+
+    Returns:
+    - dict - The country names as keys and their codes as values. Empty if the file does not exist.
+    """
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding = "utf-8") as f:
+        return json.load(f)
+
+def encode_countries(countries, path:str = country_index_path):
+    """
+    Dictionary-encode a column of countries with the persistent country index, after resolving their
+    spelling with the entity index (see entities.resolve). Countries that are not
+    in the index yet get the next free code and the index is saved, so a country keeps its code across runs.
+
+    Parameters:
+    - countries: pd.Series - The country names.
+    - path: str - The path of the JSON file with the index.
+
+    Returns:
+    - pd.Series - The int16 codes of the countries.
+
+    Raises:
+    - ValueError - If a country is missing, so that no row gets a valid looking code for the country "nan".
+    """
+    countries = resolve(pd.Series(countries), "country")
+    if countries.isna().any():
+        raise ValueError(f"{countries.isna().sum()} rows have no country, drop them before encoding the countries")
+    index = load_country_index(path)
+    new_countries = sorted(set(countries.astype(str).unique()) - set(index))
+    if new_countries:
+        next_code = max(index.values(), default = 0) + 1
+        index.update({country: next_code + i for i, country in enumerate(new_countries)})
+        with open(path, "w", encoding = "utf-8") as f:
+            json.dump(index, f, indent = 1, ensure_ascii = False)
+    return countries.astype(str).map(index).astype("int16")
+
+def create_key(df, name:str = "id_num", path:str = country_index_path):
+    """
+    Create a compact int32 key for each row from its year and the code of its country in the persistent
+    country index (year * 1000 + country code, e.g. 1990045). Joins and group-bys on this key are much
+    cheaper than on the string ids of `create_id`, which stay only as display columns. The country code
+    is also added as "country_id".
+
+    Parameters:
+    - df: pd.DataFrame - The input DataFrame with "country" and "year" columns.
+    - name: str - The name of the column to be created for the keys. Defaults to "id_num".
+    - path: str - The path of the JSON file with the country index.
+
+    Returns:
+    - pd.DataFrame - The input DataFrame with the new key column after the first column.
+
+    Raises:
+    - ValueError - If a row has no country, see `encode_countries`.
+
+    Example usage:
+    ```
+    create_key(create_id(my_df))
+    ```
+    """
+    country_id = encode_countries(df["country"], path)
+    if "country_id" not in df.columns:
+        df.insert(1, "country_id", country_id)
+    df.insert(1, name, df["year"].astype("int32") * 1000 + country_id.astype("int32"))
+    return df
+
+# Columns of the points tables that are not a voting country
+score_columns = ["Unnamed: 0", "country", "year", "Total score", "Jury score", "Televoting score", "Jury vote"]
+
+def voter_columns(df):
+    """
+    Returns the columns of a points table that hold the points given by a voting country.
+    """
+    return [col for col in df.columns if col not in score_columns]
+
+def resolve_jury_vote(jury, tele):
+    """
+    Gives back its name to the first voting country of a jury table. In some years (2016, 2018) its
+    header was scraped as "Jury vote", it is the voting country of the televote table of the same
+    year that is missing from the jury table.
+
+    Parameters:
+    - jury: pd.DataFrame - The jury table of a year.
+    - tele: pd.DataFrame - The televote table of the same year.
+
+    Returns:
+    - pd.DataFrame - The jury table, with "Jury vote" renamed when the voting country can be told.
+    """
+    missing = [col for col in voter_columns(tele) if col not in jury.columns]
+    if "Jury vote" not in jury.columns or len(missing) != 1:
+        return jury
+    return jury.rename(columns = {"Jury vote" : missing[0]})
+
+def combine_votes(jury, tele):
+    """
+    Combines the jury and televote tables of the years from 2016 onwards into a single table of points,
+    matching the rows by (year, country) instead of by position. The points of every voting country are
+    the sum of both votes, and the "Jury score" and "Televoting score" of every contestant are kept.
+
+    Parameters:
+    - jury: storage.YearDataset - The jury tables ("juryvote_<year>").
+    - tele: storage.YearDataset - The televote tables ("televote_<year>").
+
+    Returns:
+    - pd.DataFrame - A row per contestant and year with "country", "year", a column per voting country and
+      the "Jury score" and "Televoting score" columns.
+
+    Raises:
+    - ValueError - If a contestant is only in one of the tables, or if its points do not add up to its "Total score".
+    """
+    jury_frames = []
+    tele_frames = []
+    for year in sorted(set(jury.years) | set(tele.years)):
+        tele_df = tele.read_partition(year, normalise_columns)
+        jury_frames.append(resolve_jury_vote(jury.read_partition(year, normalise_columns), tele_df))
+        tele_frames.append(tele_df)
+    keys = ["year", "country"]
+    jury_df = pd.concat(jury_frames, axis = 0).set_index(keys)
+    tele_df = pd.concat(tele_frames, axis = 0).set_index(keys)
+
+    unmatched = jury_df.index.symmetric_difference(tele_df.index)
+    if len(unmatched):
+        raise ValueError(f"Contestants without both a jury and a televote table: {list(unmatched)}")
+
+    votes = jury_df[voter_columns(jury_df)].add(tele_df[voter_columns(tele_df)], fill_value = 0)
+    votes["Jury score"] = jury_df["Jury score"]
+    votes["Televoting score"] = tele_df["Televoting score"]
+
+    total = tele_df["Total score"].reindex(votes.index)
+    wrong = ((votes[voter_columns(votes)].sum(axis = 1) != total)
+             | (votes["Jury score"] + votes["Televoting score"] != total))
+    if wrong.any():
+        raise ValueError(f"Points that do not add up to the Total score: {list(votes.index[wrong])}")
+    return votes.reset_index()
+
 def concat_dataframes(lista_archivos:list, path:str):
     """
     Concatenates a list of CSV files located in a specified path into a single pandas DataFrame.
+    The files are read in parallel and concatenated once.
 
     Parameters:
     - lista_archivos: list - A list of CSV file names to be concatenated.
@@ -82,15 +268,13 @@ def concat_dataframes(lista_archivos:list, path:str):
     my_df = concat_dataframes(["file1.csv", "file2.csv"], "/path/to/folder")
     ```
     """
-    df = pd.DataFrame()
-    for file in lista_archivos:
-        prov_df = pd.read_csv(path + "/" + file)
-        df = pd.concat([df, prov_df], axis = 0)
-    return df
+    with ThreadPoolExecutor(max_workers = 8) as executor:
+        frames = list(executor.map(lambda file: pd.read_csv(path + "/" + file), lista_archivos))
+    return pd.concat(frames, axis = 0) if frames else pd.DataFrame()
 
 def to_int(df):
     """
-    Transform float columns to integers.
+    Transform float columns to integers, rounding them. Columns with missing values are left as floats.
 
     Args:
     - df: pd.DataFrame - DataFrame to be transformed.
@@ -98,131 +282,185 @@ def to_int(df):
     Returns:
     - pd.DataFrame - The transformed DataFrame with float columns cast as integers.
     """
-    for col in df.columns:
-        if df[col].dtype == float:
-            df[col] = df[col].astype(int)
-    return df
+    return floats_to_int(df)
+
+
+def build_canciones(cleaned = None):
+    """
+    Merges the songs from Wikipedia (until 2008) with the songs from the Excel file (from 2009 onwards)
+    and gives them their IDs.
+
+    Parameters:
+    - cleaned: dict - Optional output of cleaning.clean_all_data. When given, its DataFrames are
+      used straight from memory and only the files it does not have are read from "cleaned_data/"
+      (see storage.YearDataset).
 
+    Returns:
+    - pd.DataFrame - Every song with the columns of both sources.
+    """
+    cleaned = cleaned or {}
+
+    # Merging the songs from Wikipedia, only the years before 2009 are used so the rest are not even read.
+    # The column names are fixed while reading
+    canciones = YearDataset("canciones_por_anho", frames = cleaned.get("canciones_por_anho")).read(
+        years = range(1957, 2009), transform = normalise_columns)
 
-# Directory from which we're gonna access the song files
-canciones_dir = os.listdir("cleaned_data/canciones_por_anho")
-
-# Fixing column names
-for file in canciones_dir:
-    fix_colnames(file,"cleaned_data/canciones_por_anho")
-
-# Merging the data frames together
-canciones = pd.concat([pd.read_csv(f"cleaned_data/canciones_por_anho/{file}") for file in canciones_dir], axis = 0)
-
-# Dropping unwanted columns
-canciones.drop(["Unnamed: 0", "Points"],axis = 1, inplace = True)
-
-# Splitting the dataset
-canciones_08 = canciones[canciones["Year"] < 2009]
-canciones_09 = pd.read_csv("cleaned_data/songs_cleaned.csv")
-canciones_09["key"] = canciones_09["key"].apply(lambda x: x.lower())
-canciones_09 = canciones_09[canciones_09["final_draw_position"]!= 0]
-
-# Renaming the columns to match the other files 
-dict_columns= {
-    'Country': 'country', 
-    'Artist': 'artist_name', 
-    'Song': 'song_name', 
-    'Language': 'language', 
-    'Place': 'final_place', 
-    'Order': 'final_draw_position', 
-    'Year': 'year'}
-
-canciones_08 = canciones_08.rename(columns=dict_columns)
-canciones = pd.concat([canciones_08,canciones_09], axis = 0)
-
-# Dropping more columns
-canciones.drop(["semi_draw_position", 
-    "semi_place",
-    "final_televote_points",
-    "final_jury_points"], 
-    axis = 1, inplace = True )
-canciones["country"].replace(" Yugoslavia","Yugoslavia", inplace = True)
-
-# Creating ID to get data ready to upload to the mySQL database
-create_id(canciones)
-
-# Filtering out the dataset
-canciones_overview = canciones[
-    ["id" ,"country", "artist_name", "song_name", 
-     "language", "final_place", "final_draw_position","year"]]
-# Dropping more unwanted columns
-canciones_features = canciones.drop(
-    ["artist_name", "song_name", "language", 
-     "final_place", "final_draw_position"], 
-     axis = 1)
-
-# Splitting datasets according to the additional information that we have from 2009 onwards
-canciones_features = canciones_features[canciones_features["year"]>2008]
-
-# Filtering out null values
-canciones_overview = canciones_overview[canciones_overview["language"].isna() == False]
-
-# Correcting values in languages
-corrected_lang = []
-for lang in canciones_overview["language"]:
-    if "[" in lang:
-        corr_lang = lang.split("[")[0]
-        corrected_lang.append(corr_lang)
+    # Dropping unwanted columns
+    canciones.drop(["Unnamed: 0", "Points"],axis = 1, inplace = True, errors = "ignore")
+
+    # Splitting the dataset
+    canciones_08 = canciones[canciones["year"] < 2009]
+    if "songs_cleaned" not in cleaned:
+        canciones_09 = read_cleaned_file("", "songs_cleaned.csv")
     else:
-        corrected_lang.append(lang)
-canciones_overview["language"] = corrected_lang
-
-# Creating dataset for the points and countries
-puntos_dir = os.listdir("cleaned_data/puntos_por_anho")
-puntos_por_anho_2015 = concat_dataframes(puntos_dir[:len(puntos_dir)-12], "cleaned_data/puntos_por_anho")
-
-# Dropping unwanted columns
-puntos_por_anho_2015.drop(["Unnamed: 0","Total score"], axis = 1, inplace = True)
-puntos_por_anho_2015 = puntos_por_anho_2015.rename(
-    columns = 
-    {"Year" : "year",
-    "Country": "country"})
-
-# Adding data from 2016 onwards since it's split in two different
-jury_2016 = [file for file in puntos_dir if "juryvote" in file]
-jury_df = concat_dataframes(jury_2016, "cleaned_data/puntos_por_anho")
-jury_df.drop(["Total score", "Televoting score", "Jury vote"], axis = 1, inplace = True)
-
-tele_vote_2016 = [file for file in puntos_dir if "televote" in file]
-tele_df = concat_dataframes(tele_vote_2016, "cleaned_data/puntos_por_anho")
-tele_df.drop(["Total score", "Jury score"], axis = 1, inplace = True)
-
-# Merging the two datasets
-puntos_por_anho_2016 = jury_df + tele_df
-puntos_por_anho_2016.drop(["Jury score","Televoting score","Unnamed: 0"], axis = 1, inplace = True)
-
-# After adding up the two datasets, string columns need to be split in half
-puntos_por_anho_2016['Contestants']= puntos_por_anho_2016['Contestants'].apply(lambda x:x[:len(x)//2])
-puntos_por_anho_2016['Year'] = puntos_por_anho_2016['Year'].apply(lambda x:x/2).astype(int)
-# Changing column names to match the other datasets
-col_dict = {"Year": "year","Contestants": "country"}
-puntos_por_anho_2016.rename(columns= col_dict, inplace = True)
-
-# Merging the two datasets
-puntos_por_anho = pd.concat([puntos_por_anho_2015,puntos_por_anho_2016], axis = 0)
-# Filling NAs with 0
-puntos_por_anho.fillna(0, inplace = True)
-# Creating ID to get the dataset ready to upload to SQL
-create_id(puntos_por_anho, name = "_id")
-
-# Grouping languages
-a = [i for i in canciones_overview["language"].value_counts().keys() if "," in i]
-b = [sorted(i.split(", ")) for i in a]
-b = [", ".join(i) for i in b]
-replaceable = dict(zip(a, b))
-for key, value in replaceable.items():
-    replaceable[key] = value.replace("\xa0", " ")
-canciones_overview["language"].replace(replaceable, inplace = True)
-
-# Changing column dtypes from float to int after replacing nulls
-to_int(canciones_overview)
-to_int(canciones_features)
-puntos_por_anho.drop(["country","year"], axis = 1, inplace = True)
-to_int(puntos_por_anho)
-canciones_2023 = pd.read_csv("cleaned_data/clean_2023.csv")
\ No newline at end of file
+        canciones_09 = cleaned["songs_cleaned"].copy()
+    canciones_09["key"] = canciones_09["key"].apply(lambda x: x.lower())
+    canciones_09 = canciones_09[canciones_09["final_draw_position"]!= 0]
+
+    canciones = pd.concat([canciones_08,canciones_09], axis = 0)
+
+    # Dropping more columns
+    canciones.drop(["semi_draw_position", 
+        "semi_place",
+        "final_televote_points",
+        "final_jury_points"], 
+        axis = 1, inplace = True )
+    canciones["country"] = resolve(canciones["country"], "country")
+
+    # Creating ID to get data ready to upload to the mySQL database, and the integer key to join on
+    create_id(canciones)
+    create_key(canciones)
+    return canciones
+
+def build_canciones_overview(canciones):
+    """
+    Returns the overview of every song (country, artist, song, language, place...) from the
+    output of `build_canciones`, downcast to the smallest safe dtypes (see schema.downcast).
+    """
+    # Filtering out the dataset
+    canciones_overview = canciones[
+        ["id", "id_num", "country_id", "country", "artist_name", "song_name", 
+         "language", "final_place", "final_draw_position","year"]]
+
+    # Filtering out null values
+    canciones_overview = canciones_overview[canciones_overview["language"].isna() == False]
+
+    # Footnotes, spacing and the order of combined languages are fixed by the entity index
+    canciones_overview["language"] = resolve(canciones_overview["language"], "language")
+
+    # Changing column dtypes from float to int after replacing nulls
+    to_int(canciones_overview)
+    return compact(canciones_overview, "canciones_overview")
+
+def build_canciones_features(canciones):
+    """
+    Returns the musical features of the songs from 2009 onwards from the output of `build_canciones`,
+    downcast to the smallest safe dtypes (see schema.downcast).
+    """
+    # Dropping more unwanted columns
+    canciones_features = canciones.drop(
+        ["artist_name", "song_name", "language", 
+         "final_place", "final_draw_position"], 
+         axis = 1)
+
+    # Splitting datasets according to the additional information that we have from 2009 onwards
+    canciones_features = canciones_features[canciones_features["year"]>2008]
+
+    # Changing column dtypes from float to int after replacing nulls
+    to_int(canciones_features)
+    return compact(canciones_features, "canciones_features")
+
+def build_puntos(cleaned = None):
+    """
+    Builds the table of the points every country gave to every contestant and year, downcast to
+    the smallest safe dtypes (see schema.downcast).
+
+    Parameters:
+    - cleaned: dict - Optional output of cleaning.clean_all_data, see `build_canciones`.
+
+    Returns:
+    - pd.DataFrame - A row per contestant and year with a column per voting country, plus the
+      "Jury score" and "Televoting score" of the years from 2016 onwards (0 before).
+    """
+    cleaned = cleaned or {}
+
+    # Creating dataset for the points and countries
+    puntos_frames = cleaned.get("puntos_por_anho")
+    puntos_por_anho_2015 = YearDataset("puntos_por_anho", frames = puntos_frames).read(transform = normalise_columns)
+
+    # Dropping unwanted columns
+    puntos_por_anho_2015.drop(["Unnamed: 0","Total score"], axis = 1, inplace = True, errors = "ignore")
+
+    # Adding data from 2016 onwards, split in a jury and a televote table per year
+    puntos_por_anho_2016 = combine_votes(YearDataset("puntos_por_anho", "juryvote", puntos_frames),
+                                         YearDataset("puntos_por_anho", "televote", puntos_frames))
+
+    # Merging the two datasets
+    puntos_por_anho = pd.concat([puntos_por_anho_2015,puntos_por_anho_2016], axis = 0)
+    puntos_por_anho["country"] = resolve(puntos_por_anho["country"], "country")
+    # Filling NAs with 0
+    puntos_por_anho.fillna(0, inplace = True)
+    # Creating ID to get the dataset ready to upload to SQL
+    create_id(puntos_por_anho, name = "_id")
+    create_key(puntos_por_anho, name = "_id_num")
+
+    # Changing column dtypes from float to int after replacing nulls
+    puntos_por_anho.drop(["country","year"], axis = 1, inplace = True)
+    to_int(puntos_por_anho)
+    return compact(puntos_por_anho, "puntos_por_anho")
+
+def load_canciones_2023():
+    """
+    Returns the songs of 2023, the ones the models predict on.
+    """
+    return pd.read_csv("cleaned_data/clean_2023.csv")
+
+def build_tables(cleaned = None):
+    """
+    Builds the tables that are uploaded to the SQL database from the cleaned data, computing every
+    stage. To compute only the stages whose inputs changed use pipeline.get instead, e.g.
+    pipeline.get("canciones_overview").
+
+    Parameters:
+    - cleaned: dict - Optional output of cleaning.clean_all_data. When given, its DataFrames are
+      used straight from memory and only the files it does not have are read from "cleaned_data/"
+      (see storage.YearDataset).
+
+    Returns:
+    - dict - A dictionary with the DataFrames "canciones_overview", "canciones_features",
+      "puntos_por_anho" and "canciones_2023". The first three are downcast to the smallest
+      safe dtypes, see schema.downcast.
+
+    Example usage:
+    ```
+    tables = build_tables(cleaning.clean_all_data(checkpoint = False))
+    ```
+    """
+    canciones = build_canciones(cleaned)
+    return {
+        "canciones_overview" : build_canciones_overview(canciones),
+        "canciones_features" : build_canciones_features(canciones),
+        "puntos_por_anho" : build_puntos(cleaned),
+        "canciones_2023" : load_canciones_2023()}
+
+
+# Stages of the pipeline, computed on demand and memoised by the hash of their inputs (see pipeline.py)
+# Stages that resolve countries or languages also depend on the index of entities (see entities.update_entities)
+pipeline.register("canciones", build_canciones,
+                  files = ["cleaned_data/canciones_por_anho/*", "cleaned_data/songs_cleaned.*", country_index_path,
+                           entities_path])
+pipeline.register("canciones_overview", build_canciones_overview, deps = ["canciones"], files = [entities_path])
+pipeline.register("canciones_features", build_canciones_features, deps = ["canciones"])
+pipeline.register("puntos_por_anho", build_puntos,
+                  files = ["cleaned_data/puntos_por_anho/*", country_index_path, entities_path])
+pipeline.register("canciones_2023", load_canciones_2023, files = ["cleaned_data/clean_2023.csv"])
+
+tables = ["canciones_overview", "canciones_features", "puntos_por_anho", "canciones_2023"]
+
+def __getattr__(name):
+    """
+    Keeps `transforming.canciones_overview` and the rest of the tables working, computed on first use.
+    """
+    if name in tables:
+        return pipeline.get(name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -2,6 +2,8 @@ import random
 import pandas as pd
 import matplotlib.pyplot as plt
 import matplotlib as mpl
+import pipeline
+from storage import read_cleaned_file
 
 colours = [
     'cornflowerblue', # Azul claro
@@ -23,23 +25,38 @@ colours = [
     'peachpuff' # Melocoton
     ]
 
-songs_df = pd.read_csv("cleaned_data/songs_cleaned.csv")
+def load_songs():
+    """
+    Returns the cleaned songs from 2009 onwards, as they are in "cleaned_data/songs_cleaned" (Parquet, or the legacy csv).
+    """
+    return read_cleaned_file("", "songs_cleaned.csv")
+
+pipeline.register("songs_df", load_songs, files = ["cleaned_data/songs_cleaned.*"])
+
+def __getattr__(name):
+    """
+    Keeps `visualization.songs_df` working, read on first use.
+    """
+    if name == "songs_df":
+        return pipeline.get("songs_df")
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
-def plot_data(df = songs_df, colours = colours):
+def plot_data(df = None, colours = colours):
     """
     Plot a bar chart for every categorical value and a histogram for continuous values.
 
     Args:
-        df: Pandas DataFrame. Defaults to songs_df (pd.read_excel("song_data_completo.xlsx")).
+        df: Pandas DataFrame. Defaults to the "songs_df" stage (cleaned_data/songs_cleaned.csv).
         colours: List of str. Defaults to colours (colours).
 
     Returns:
         None
     """
-    songs_df["year"] = songs_df["year"].astype("category")
-    for col in songs_df.columns:
-        if songs_df[col].dtype == "object":
-            songs_df[col] = songs_df[col].astype("category")
+    df = (pipeline.get("songs_df") if df is None else df).copy()
+    df["year"] = df["year"].astype("category")
+    for col in df.columns:
+        if df[col].dtype == "object":
+            df[col] = df[col].astype("category")
     cols = df.columns
     for col in cols:
         color = random.choice(colours)
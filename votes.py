@@ -0,0 +1,248 @@
+import numpy as np
+import pandas as pd
+import pipeline
+from entities import entities_path
+from storage import YearDataset
+from transforming import (country_index_path, encode_countries, load_country_index, normalise_columns,
+                          resolve_jury_vote, voter_columns)
+
+# Codes of the sources of the points. "combined" are the points of the years with a single vote
+# (until 2015), from 2016 onwards the jury and the televote are stored apart.
+sources = ["combined", "jury", "televote"]
+
+
+class VoteStore:
+    """
+    Sparse, long-format store of the points every country gave to every contestant:
+    (year, from_country, to_country, source, points), only for the votes worth points.
+    From 2016 the jury and televote points of a voter are kept apart, as two votes with their own
+    source; they are only added up when asked (`combine` in `frame`, `received` and `given`, or
+    the "combined" `matrix`).
+
+    The votes are stored in compressed rows, one row per contestant (to_country, year, source) sorted
+    in that order, including the contestants that got no points. Rows keep their year, recipient and source and the range of their votes in `offsets`; every
+    vote only keeps its voting country and its points. Countries are the int16 codes of the
+    persistent country index (see transforming.encode_countries), sources the int8 codes of `sources`.
+    The votes received by a country are then a contiguous slice found with a binary search, and
+    the votes given by a country an index lookup.
+
+    Args:
+        year, from_country, to_country, source, points: array-like - One value per vote. Votes
+            worth 0 points are dropped.
+        contestants: tuple - Optional arrays (to_country, year, source) of every contestant, to keep
+            a row for the contestants without votes.
+        path: str - The path of the country index, to name the countries.
+
+    Example usage:
+    ```
+    votes = pipeline.get("votes")
+    votes.received("Sweden", source = "televote")
+    votes.matrix(years = range(1990, 2000))
+    ```
+    """
+
+    def __init__(self, year, from_country, to_country, source, points, contestants = None, path = country_index_path):
+        year, from_country, to_country, source, points = (
+            np.asarray(values) for values in (year, from_country, to_country, source, points))
+        keep = points > 0
+        order = np.lexsort((from_country[keep], source[keep], year[keep], to_country[keep]))
+        year, from_country, to_country, source, points = (
+            values[keep][order] for values in (year, from_country, to_country, source, points))
+
+        # Rows of the contestants that got no points are kept, empty, so the wide view keeps them too
+        vote_keys = self.row_key(to_country, year, source)
+        row_keys = vote_keys if contestants is None else np.r_[vote_keys, self.row_key(*contestants)]
+        row_keys = np.unique(row_keys)
+        self.row_to = (row_keys // 100000).astype("int16")
+        self.row_year = (row_keys // 10 % 10000).astype("int16")
+        self.row_source = (row_keys % 10).astype("int8")
+        self.offsets = np.r_[np.searchsorted(vote_keys, row_keys), len(points)].astype("int32")
+        self.from_country = from_country.astype("int16")
+        self.points = points.astype("int8")
+
+        index = load_country_index(path)
+        self.countries = np.empty(max(index.values(), default = 0) + 1, dtype = object)
+        for country, code in index.items():
+            self.countries[code] = country
+        self.codes = index
+        # Votes sorted by voting country, built on the first `given`
+        self.voter_order = None
+
+    @staticmethod
+    def row_key(to_country, year, source):
+        """
+        Returns the int64 keys of rows that sort by (to_country, year, source).
+        """
+        return (np.asarray(to_country, dtype = "int64") * 10000 + np.asarray(year, dtype = "int64")) * 10 + np.asarray(source)
+
+    @classmethod
+    def from_frames(cls, frames, path = country_index_path):
+        """
+        Builds the store from wide points tables, with a row per contestant and year, a "country" and
+        a "year" column and a column per voting country.
+
+        Args:
+            frames: list - Tuples (df, source), source being one of `sources`.
+            path: str - The path of the country index.
+
+        Returns:
+            VoteStore - The votes of every table.
+        """
+        columns = {"year" : [], "from_country" : [], "to_country" : [], "source" : [], "points" : []}
+        contestants = {"to_country" : [], "year" : [], "source" : []}
+        for df, source in frames:
+            voters = voter_columns(df)
+            values = df[voters].fillna(0).to_numpy()
+            rows, cols = np.nonzero(values > 0)
+            columns["year"].append(df["year"].to_numpy()[rows])
+            columns["to_country"].append(encode_countries(df["country"], path).to_numpy()[rows])
+            columns["from_country"].append(encode_countries(pd.Series(voters), path).to_numpy()[cols])
+            columns["source"].append(np.full(len(rows), sources.index(source)))
+            columns["points"].append(np.rint(values[rows, cols]))
+            contestants["to_country"].append(encode_countries(df["country"], path).to_numpy())
+            contestants["year"].append(df["year"].to_numpy())
+            contestants["source"].append(np.full(len(df), sources.index(source)))
+        arrays = {name: np.concatenate(values) if values else np.array([], dtype = int) for name, values in columns.items()}
+        contestants = [np.concatenate(values) if values else np.array([], dtype = int) for values in contestants.values()]
+        return cls(contestants = contestants, path = path, **arrays)
+
+    @classmethod
+    def from_cleaned(cls, cleaned = None, path = country_index_path):
+        """
+        Builds the store from the cleaned points tables in "cleaned_data/puntos_por_anho".
+
+        Args:
+            cleaned: dict - Optional output of cleaning.clean_all_data, see transforming.build_canciones.
+            path: str - The path of the country index.
+
+        Returns:
+            VoteStore - The votes of every year.
+        """
+        frames = (cleaned or {}).get("puntos_por_anho")
+        combined = YearDataset("puntos_por_anho", frames = frames)
+        jury = YearDataset("puntos_por_anho", "juryvote", frames)
+        tele = YearDataset("puntos_por_anho", "televote", frames)
+
+        tables = [(combined.read_partition(year, normalise_columns), "combined") for year in combined.years]
+        for year in sorted(set(jury.years) & set(tele.years)):
+            tele_df = tele.read_partition(year, normalise_columns)
+            jury_df = resolve_jury_vote(jury.read_partition(year, normalise_columns), tele_df)
+            tables += [(jury_df, "jury"), (tele_df, "televote")]
+        return cls.from_frames(tables, path)
+
+    def __len__(self):
+        return len(self.points)
+
+    def memory_mb(self):
+        """
+        Returns the memory used by the arrays of the store in MB.
+        """
+        arrays = [self.row_year, self.row_to, self.row_source, self.offsets, self.from_country, self.points]
+        return sum(array.nbytes for array in arrays) / 1024 ** 2
+
+    def code(self, country):
+        """
+        Returns the code of a country, raising a KeyError if it is not in the country index.
+        """
+        return self.codes[country]
+
+    def rows_of_votes(self, positions):
+        """
+        Returns the row of each vote in `positions`.
+        """
+        return np.searchsorted(self.offsets, positions, side = "right") - 1
+
+    def frame(self, positions = None, source = None, years = None, combine = False):
+        """
+        Returns votes as a long DataFrame with the columns year, from_country, to_country, source and points.
+
+        Args:
+            positions: array-like - Optional positions of the votes. Defaults to every vote.
+            source: str - Optional source to keep, "jury" or "televote". "combined" (or None) keeps every
+                vote, the combined points of a year being the sum of its sources.
+            years: iterable - Optional years to keep.
+            combine: bool - If True the jury and televote points of a voter and contestant are added up
+                in a single "combined" vote, otherwise every source keeps its own vote.
+
+        Returns:
+            pd.DataFrame - The votes, with categorical countries and sources.
+        """
+        positions = np.arange(len(self)) if positions is None else np.asarray(positions)
+        rows = self.rows_of_votes(positions)
+        keep = np.ones(len(positions), dtype = bool)
+        if source not in (None, "combined"):
+            keep &= self.row_source[rows] == sources.index(source)
+        if years is not None:
+            keep &= np.isin(self.row_year[rows], list(years))
+        positions, rows = positions[keep], rows[keep]
+
+        countries = sorted(self.codes)
+        df = pd.DataFrame({
+            "year" : self.row_year[rows],
+            "from_country" : pd.Categorical(self.countries[self.from_country[positions]], countries),
+            "to_country" : pd.Categorical(self.countries[self.row_to[rows]], countries),
+            "source" : pd.Categorical.from_codes(self.row_source[rows], sources),
+            "points" : self.points[positions]})
+        if combine:
+            df = df.groupby(["year", "from_country", "to_country"], observed = True, as_index = False)["points"].sum()
+            df.insert(3, "source", pd.Categorical.from_codes(np.zeros(len(df), dtype = "int8"), sources))
+            df["points"] = df["points"].astype("int16")
+        return df
+
+    def received(self, country, source = None, years = None, combine = False):
+        """
+        Returns the votes received by a country, see `frame` for `source`, `years` and `combine`.
+        """
+        code = self.code(country)
+        first, last = np.searchsorted(self.row_to, [code, code + 1])
+        return self.frame(np.arange(self.offsets[first], self.offsets[last]), source, years, combine)
+
+    def given(self, country, source = None, years = None, combine = False):
+        """
+        Returns the votes given by a country, see `frame` for `source`, `years` and `combine`.
+        """
+        if self.voter_order is None:
+            self.voter_order = np.argsort(self.from_country, kind = "stable").astype("int32")
+        voters = self.from_country[self.voter_order]
+        code = self.code(country)
+        first, last = np.searchsorted(voters, [code, code + 1])
+        return self.frame(np.sort(self.voter_order[first:last]), source, years, combine)
+
+    def matrix(self, source = "combined", years = None):
+        """
+        Pivots the votes back to the wide view: a row per contestant and year and a column per voting country.
+
+        Args:
+            source: str - "combined" for the total points, "jury" or "televote" for a single source.
+            years: iterable - Optional years to keep.
+
+        Returns:
+            pd.DataFrame - The int16 points, indexed by (year, country) and sorted by year, with a column
+            per voting country sorted by name and 0 for the countries that gave no points.
+        """
+        rows = np.ones(len(self.row_to), dtype = bool)
+        if source != "combined":
+            rows &= self.row_source == sources.index(source)
+        if years is not None:
+            rows &= np.isin(self.row_year, list(years))
+        rows = np.flatnonzero(rows)
+
+        # The rows of the sources of a contestant add up in the same row of the matrix
+        contestant_keys = self.row_year[rows].astype("int64") * 10000 + self.row_to[rows]
+        contestants, contestant_of_row = np.unique(contestant_keys, return_inverse = True)
+        counts = np.diff(self.offsets)[rows]
+        positions = np.repeat(self.offsets[rows], counts) + np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        voter_codes, voter_of_vote = np.unique(self.from_country[positions], return_inverse = True)
+
+        matrix = np.zeros((len(contestants), len(voter_codes)), dtype = "int16")
+        np.add.at(matrix, (np.repeat(contestant_of_row, counts), voter_of_vote), self.points[positions])
+        index = pd.MultiIndex.from_arrays(
+            [contestants // 10000, self.countries[contestants % 10000]], names = ["year", "country"])
+        voters = self.countries[voter_codes]
+        order = np.argsort(voters)
+        matrix, voters = matrix[:, order], voters[order]
+        return pd.DataFrame(matrix, index = index, columns = voters)
+
+
+pipeline.register("votes", VoteStore.from_cleaned,
+                  files = ["cleaned_data/puntos_por_anho/*", country_index_path, entities_path])
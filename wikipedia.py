@@ -1,16 +1,184 @@
-from urllib.request import Request, urlopen
-from bs4 import BeautifulSoup
+from bs4 import BeautifulSoup, SoupStrainer
 import pandas as pd
-from more_itertools import chunked
+import hashlib
+import json
 import os
+import re
+from fetch_lib import PageCache, fetch_pages, print_report
+
+# lxml builds the tree several times faster than the standard library parser
+try:
+    import lxml
+    parser = "lxml"
+except ImportError:
+    parser = "html.parser"
 
 years = list(range(1957, 2023))
 base_url = "https://en.wikipedia.org/wiki/Eurovision_Song_Contest_"
 basic_headers = {"user-agent" : "Mozilla/5.0"}
+cache_dir = "cache/wikipedia"
+# Directory of the scraped files (/2016_2022, /puntos_por_anho, /canciones_por_anho) and of their manifest,
+# so that they end up together whatever the working directory is
+data_dir = os.path.dirname(os.path.abspath(__file__))
+manifest_path = os.path.join(data_dir, "scrape_manifest.json")
+# While parsing, the class attribute is still a single string like "sortable wikitable plainrowheaders"
+wikitables = SoupStrainer("table", class_ = lambda css_class: css_class is not None and "wikitable" in css_class.split())
+
+def get_year_pages(years = years,
+                   base_url = base_url,
+                   basic_headers = basic_headers,
+                   max_workers = 8,
+                   cache_dir = cache_dir,
+                   offline = False):
+    """
+    Downloads the Wikipedia page of every year concurrently.
+
+    Pages are kept in an on-disk cache and revalidated with conditional requests, so pages that
+    did not change since the last run are not downloaded again.
+
+    Args:
+        - years: List of integers representing the years of the festival to download.
+        - base_url: Base URL to retrieve the Wikipedia page from.
+        - basic_headers: A dictionary with the headers to use when sending the request.
+        - max_workers: Maximum number of pages downloaded at the same time.
+        - cache_dir: Directory of the page cache. None disables the cache.
+        - offline: If True, pages are served only from the cache and the network is never used.
+
+    Returns:
+        A dictionary with the years that could be downloaded as keys and the raw page as values.
+        Years that failed are printed together with their error.
+    """
+    urls = {year: base_url + str(year) for year in years}
+    cache = PageCache(cache_dir) if cache_dir else None
+    pages, report = fetch_pages(urls, basic_headers, max_workers = max_workers,
+                                cache = cache, offline = offline)
+    print_report(report)
+    return pages
+
+def table_title(table):
+    """
+    Returns the caption of a table, or the text of its first row if it has no caption.
+
+    It is used to tell the tables of a page apart without serialising them with str().
+    """
+    if table.caption is not None:
+        return table.caption.get_text(" ", strip = True)
+    first_row = table.find("tr")
+    return first_row.get_text(" ", strip = True) if first_row is not None else ""
+
+def find_votes_table(tables):
+    """
+    Finds the table of the votes casted in the final among the wikitables of a year page.
+
+    Args:
+        - tables: List of bs4 tables of a year page.
+
+    Returns:
+        The bs4 table of the final voting results. If no caption matches, the last
+        "wikitable plainrowheaders" table of the page. None if there is no such table.
+    """
+    target_table = None
+    for table in tables:
+        if table.get("class") != ["wikitable", "plainrowheaders"]:
+            continue
+        target_table = table
+        title = table_title(table)
+        if "Detailed voting results of the final" in title or "Final voting results" in title:
+            break
+        elif "Detailed voting results" in title and "semi" not in title.lower() and "qualifying" not in title.lower():
+            break
+    return target_table
+
+def header_texts(table):
+    """
+    Returns the text of the header cells in the first two rows of a table, without
+    Wikipedia notes like "[12]" or "(s)".
+    """
+    texts = []
+    for tr in table.find_all("tr", limit = 2):
+        for th in tr.find_all("th", recursive = False):
+            texts.append(th.get_text(" ", strip = True).split("[")[0].split("(")[0].strip())
+    return texts
+
+def find_songs_table(tables):
+    """
+    Finds the table of the songs that took part in the final among the wikitables of a year page.
+
+    A songs table is any table whose header has a country, a song and its points or place.
+    Semi-final and qualifying round tables are left out and a caption mentioning the final
+    is preferred.
+
+    Args:
+        - tables: List of bs4 tables of a year page.
+
+    Returns:
+        The bs4 table of the songs of the final, or None for the years without one.
+    """
+    candidates = []
+    for table in tables:
+        headers = header_texts(table)
+        if "Country" in headers and "Song" in headers and ("Points" in headers or "Place" in headers):
+            title = table_title(table).lower()
+            if "semi" not in title and "qualif" not in title and "kvalifikacija" not in title:
+                candidates.append((title, table))
+
+    for title, table in candidates:
+        if "final" in title:
+            return table
+    return candidates[0][1] if candidates else None
+
+def extract_year_tables(raw_web):
+    """
+    Parses a year page once and extracts both the votes table and the songs table.
+
+    Only the "wikitable" subtrees of the page are built, the rest of the page is skipped
+    by the parser.
+
+    Args:
+        - raw_web: Raw page as bytes or str.
+
+    Returns:
+        A tuple (votes_table, songs_table) of bs4 tables. Any of them can be None if the page
+        does not have it.
+    """
+    soup = BeautifulSoup(raw_web, parser, parse_only = wikitables)
+    tables = soup.find_all("table", class_ = "wikitable")
+    return find_votes_table(tables), find_songs_table(tables)
+
+def get_year_tables(years = years,
+                    base_url = base_url,
+                    basic_headers = basic_headers,
+                    max_workers = 8,
+                    offline = False):
+    """
+    Downloads the page of every year and extracts its votes and songs tables in a single pass.
+
+    Args:
+        - years: List of integers representing the years of the festival to retrieve data for.
+        - base_url: Base URL to retrieve the Wikipedia page from.
+        - basic_headers: A dictionary with the headers to use when sending the request.
+        - max_workers: Maximum number of pages downloaded at the same time.
+        - offline: If True, pages are served only from the page cache.
+
+    Returns:
+        A dictionary with the years as keys and a tuple (votes_table, songs_table) as values.
+    """
+    tablas = {}
+    pages = get_year_pages(years, base_url, basic_headers, max_workers, offline = offline)
+
+    for year, raw_web in pages.items():
+        try:
+            tablas[year] = extract_year_tables(raw_web)
+        except Exception as e:
+            print(f"    {year}: tables could not be extracted ({e!r})")
+
+    return tablas
 
 def get_table_points_year(years = years, 
                           base_url = base_url, 
-                          basic_headers = basic_headers):
+                          basic_headers = basic_headers,
+                          max_workers = 8,
+                          offline = False):
     
     """
     Retrieves the Wikipedia table information of the votes casted by all the participants of that year's festival
@@ -20,126 +188,158 @@ def get_table_points_year(years = years,
         - years: List of integers representing the years of the festival to retrieve data for.
         - base_url: Base URL to retrieve the Wikipedia page from.
         - basic_headers: A dictionary with the headers to use when sending the request.
+        - max_workers: Maximum number of pages downloaded at the same time.
+        - offline: If True, pages are served only from the page cache.
 
     Returns:
         A dictionary with the years as keys and a BeautifulSoup object containing the Wikipedia table information
         of the votes casted by all the participants of that year's festival.
     """
-    
-    diccionario = {}
-    
-    for year in years:
-        url = base_url + str(year)
-        
-        try:
-            req = Request(url, headers = basic_headers)
-            raw_web = urlopen(req, timeout = 10).read()
-            soup = BeautifulSoup(raw_web, "html.parser")
-            tables = soup.find_all("table", attrs = {
-                "class" : "wikitable plainrowheaders"})
-
-            for table in tables:
-                if "Detailed voting results of the final" in str(table):
-                    target_table = table
-                    break
-                elif "Final voting results" in str(table):
-                    target_table = table
-                    break
-                elif "Detailed voting results" in str(table) and "semi" not in str(table) and "qualifying" not in str(table):
-                    target_table = table
-                    break
-                else:
-                    pass
-
-            diccionario[year] = table  
-            
-        except:
-            pass
-        
-    return diccionario
+    tablas = get_year_tables(years, base_url, basic_headers, max_workers, offline)
+    return {year: votes for year, (votes, songs) in tablas.items() if votes is not None}
+
+def span(cell, attribute):
+    """
+    Returns the rowspan/colspan of a cell as an integer, ignoring malformed values like "2;".
+    """
+    digits = "".join(c for c in cell.get(attribute, "1") if c.isdigit())
+    return max(int(digits), 1) if digits else 1
+
+def table_grid(table):
+    """
+    Walks the rows of a table once and resolves rowspan/colspan into a rectangular grid.
+
+    Args:
+        - table: bs4 table.
+
+    Returns:
+        A list with a list per row holding, for every grid column, a tuple (cell, text) with the
+        bs4 cell covering that position and its text, or None if no cell covers it.
+    """
+    grid = []
+    pending = {}   # column -> ((cell, text), rows still covered)
+    for tr in table.find_all("tr"):
+        if tr.find_parent("table") is not table:
+            continue
+        cells = tr.find_all(["th", "td"], recursive = False)
+        row = []
+        col = 0
+        i = 0
+        while i < len(cells) or any(c >= col for c in pending):
+            if col in pending:
+                entry, left = pending.pop(col)
+                if left > 1:
+                    pending[col] = (entry, left - 1)
+                row.append(entry)
+                col += 1
+            elif i < len(cells):
+                cell = cells[i]
+                i += 1
+                entry = (cell, cell.text.strip("\n").strip("\xa0"))
+                rowspan = span(cell, "rowspan")
+                for _ in range(span(cell, "colspan")):
+                    if rowspan > 1:
+                        pending[col] = (entry, rowspan - 1)
+                    row.append(entry)
+                    col += 1
+            else:
+                row.append(None)
+                col += 1
+        grid.append(row)
+    return grid
+
+def typed_column(values):
+    """
+    Converts a list of cell texts into a typed pd.Series: nullable integers if every non empty value
+    is an integer, floats if they are numbers, and the original strings otherwise.
+    """
+    column = pd.Series(values, dtype = "object")
+    column = column.where(column != "")
+    numbers = pd.to_numeric(column, errors = "coerce")
+    if numbers.isna().sum() != column.isna().sum():
+        return pd.Series(values, dtype = "object")
+    if (numbers.dropna() % 1 == 0).all():
+        return numbers.astype("Int64")
+    return numbers
+
+def table_to_frame(table, row_header = "Country"):
+    """
+    Converts a Wikipedia table into a pd.DataFrame with one column per labelled grid column.
+
+    Header rows are the rows with column headers (th scope="col") and no row header. Every grid
+    column takes the label of the lowest header cell above it, so group headers like "Voting results"
+    are replaced by the country names below them. Data rows are the rows with a row header
+    (th scope="row"), whose column is named `row_header`. Unlabelled columns, such as the rotated
+    "Contestants" cell spanning every row of the voting tables, are dropped.
+
+    Args:
+        - table: bs4 table.
+        - row_header: Name of the column built from the row headers.
+
+    Returns:
+        pd.DataFrame with typed columns, see `typed_column`.
+    """
+    grid = table_grid(table)
+    width = max((len(row) for row in grid), default = 0)
+    labels = [""] * width
+    data_rows = []
+
+    for row in grid:
+        scopes = [entry[0].get("scope") for entry in row if entry is not None and entry[0].name == "th"]
+        if "row" in scopes:
+            data_rows.append(row + [None] * (width - len(row)))
+        elif "col" in scopes:
+            for col, entry in enumerate(row):
+                if entry is not None and entry[0].name == "th":
+                    labels[col] = entry[1]
+
+    for row in data_rows:
+        for col, entry in enumerate(row):
+            cell = entry[0] if entry is not None else None
+            if cell is not None and cell.name == "th" and cell.get("scope") == "row" and span(cell, "rowspan") == 1:
+                labels[col] = row_header
+
+    columns = {}
+    for col, label in enumerate(labels):
+        if label and label not in columns:
+            values = [row[col][1] if row[col] is not None else "" for row in data_rows]
+            columns[label] = values if label == row_header else typed_column(values)
+
+    return pd.DataFrame(columns)
 
 def bs4_to_pandas_votes(bs4_object):
     """
     bs4_object : bs4 object
     return : pd.DataFrame
 
-    It takes a bs4 object and returns a pandas dataframe.
-    """
-    headers = bs4_object.find_all('th', attrs = {"scope" : "col"})
-    cabecera=[i.text.strip("\n") for i in headers]
-    paises_b = bs4_object.find_all('th', attrs = {"scope" : "row"})
-    paises = [i.text.strip("\n") for i in paises_b]
-    row = bs4_object.find_all('td')
-    try:
-        filas = [i.text.strip("\n").strip("\xa0") for i in row]
-        divisor = len(cabecera)
-        resultado = list(chunked(filas,divisor))
-        df = pd.DataFrame(resultado,columns = cabecera)
-        df["Country"] = paises
-        
-    except:
-        filas = [i.text.strip("\n").strip("\xa0") for i in row if 'style="background:' not in str(i)][1:]
-        divisor = len(cabecera)
-        resultado = list(chunked(filas,divisor))
-        df = pd.DataFrame(resultado,columns = cabecera)
-        df["Country"] = paises
-
-    return df
+    It takes the bs4 table of the votes of a final and returns a pandas dataframe with
+    a column for the total score, a column per voting country and the "Country" that received the points.
+    """
+    df = table_to_frame(bs4_object, row_header = "Country")
+    return df[[col for col in df.columns if col != "Country"] + ["Country"]]
 
 def get_table_songs_year(years = years, 
                          base_url = base_url, 
-                         basic_headers = basic_headers):
+                         basic_headers = basic_headers,
+                         max_workers = 8,
+                         offline = False):
     
     """
+    Retrieves the Wikipedia table of the songs of the final of that year's festival for a list of years.
+
     Args:
-    - bs4_object: BeautifulSoup object - The bs4 object to be transformed.
+        - years: List of integers representing the years of the festival to retrieve data for.
+        - base_url: Base URL to retrieve the Wikipedia page from.
+        - basic_headers: A dictionary with the headers to use when sending the request.
+        - max_workers: Maximum number of pages downloaded at the same time.
+        - offline: If True, pages are served only from the page cache.
 
     Returns:
-    - pd.DataFrame - The transformed DataFrame containing table information of the votes casted
-    by all the participants of that year's festival.
+        A dictionary with the years as keys and a BeautifulSoup object containing the Wikipedia table
+        of the songs of that year's final. Years without table are left out.
     """
-    
-    anhos_y_canciones = {}
-
-    for year in years:
-        url = base_url + str(year)
-        req = Request(url, headers = basic_headers)
-        raw_web = urlopen(req, timeout = 10).read()
-        soup = BeautifulSoup(raw_web, "html.parser")
-        
-        if year in [2002,2003,2007]:
-            pass
-        else:
-            
-            if year ==  2021:
-                tables = soup.find_all("table", attrs = {
-                "class" : "wikitable sortable plainrowheaders"})
-            else:
-                tables = soup.find_all("table", attrs = {
-                "class" : "sortable wikitable plainrowheaders"})
-
-            if year < 1997:
-                target_table = tables[0]
-            elif year < 2007:
-                target_table = tables[1]
-            elif year < 2014:
-                target_table = tables[2]
-            elif year < 2016:
-                target_table = tables[3]
-            elif year < 2019:
-                target_table = tables[2]
-            elif year == 2019:
-                target_table = tables[0]
-            elif year == 2020:
-                target_table = None
-            elif year == 2021:
-                target_table = tables[0]
-            elif year == 2022:
-                target_table = tables[2]
-
-            anhos_y_canciones[year] = target_table
-        
-    return anhos_y_canciones
+    tablas = get_year_tables(years, base_url, basic_headers, max_workers, offline)
+    return {year: songs for year, (votes, songs) in tablas.items() if songs is not None}
 
 def bs4_to_pandas_songs(bs4_object):
     """
@@ -156,50 +356,134 @@ def bs4_to_pandas_songs(bs4_object):
         - Points: int - The number of points the song received in the competition.
         - Order: int - The order in which the song was performed during the competition.
     """
-    headers = bs4_object.find_all('th', attrs = {"scope" : "col"})
-    cabecera=[i.text.strip("\n") for i in headers][1:]
-    row = bs4_object.find_all('td')
-    filas = [i.text.strip("\n").strip("\xa0") for i in row]
-    divisor = len(cabecera)
-    resultado = list(chunked(filas,divisor))
-    casi_df = pd.DataFrame(resultado,columns = cabecera)
-    casi_df["Order"] = list(range(1,len(resultado) + 1))
+    casi_df = table_to_frame(bs4_object, row_header = "Order")
+    casi_df = casi_df[[col for col in casi_df.columns if col != "Order"]]
+    casi_df["Order"] = list(range(1,len(casi_df) + 1))
     return casi_df   
 
 
-for csv in os.listdir("2016_2022"):
-    df= pd.read_csv(f'2016_2022/{csv}')
-    year= csv.split('_')[1][:4]
-    df["Year"]= year
-    df.to_csv(f'puntos_por_anho/{csv}', sep=',', encoding='utf-8', index=False)
+def load_manifest(path = manifest_path):
+    """
+    Loads the scrape manifest, a dictionary with an entry per "<kind>/<year>" with the "revision" of
+    the source page, the "sha256" of the source and the "output" file written from it.
+    Returns an empty manifest if the file does not exist.
+    """
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r") as f:
+        return json.load(f)
+
+def save_manifest(manifest, path = manifest_path):
+    """
+    Writes the scrape manifest to disk, see `load_manifest`.
+    """
+    with open(path, "w") as f:
+        json.dump(manifest, f, indent = 1, sort_keys = True)
+
+def page_revision(raw_web):
+    """
+    Returns the Wikipedia revision id of a raw page, or None if the page does not have one.
+    """
+    match = re.search(rb'"wgRevisionId":(\d+)', raw_web if isinstance(raw_web, bytes) else raw_web.encode())
+    return int(match.group(1)) if match else None
+
+def is_up_to_date(manifest, key, sha256 = None, revision = None, data_dir = data_dir):
+    """
+    Checks whether the manifest entry `key` exists, its output file is still on disk and it was
+    built from the same source: the same Wikipedia `revision` when both the page and the entry have
+    one, otherwise the same `sha256`, since a page re-rendered without a new revision (e.g. with a new
+    ETag) has a different hash. Without `sha256` and `revision` only the existence is checked.
+    Entries without output record pages that do not have that table. Outputs are relative to `data_dir`.
+    """
+    entry = manifest.get(key)
+    if entry is None or (entry["output"] is not None and not os.path.exists(os.path.join(data_dir, entry["output"]))):
+        return False
+    if revision is not None and entry.get("revision") is not None:
+        return entry["revision"] == revision
+    return sha256 is None or entry["sha256"] == sha256
+
+def copy_split_votes(manifest_path = manifest_path, data_dir = data_dir):
+    """
+    Copies the 2016-2022 jury and televote files in /2016_2022 to /puntos_por_anho adding the "Year"
+    column. Only files that are new or changed since the last copy, according to the manifest, are rewritten.
+    Called by `get_wikipedia_data`.
+    """
+    manifest = load_manifest(manifest_path)
+    changed = False
+
+    for csv in os.listdir(os.path.join(data_dir, "2016_2022")):
+        with open(os.path.join(data_dir, "2016_2022", csv), "rb") as f:
+            sha256 = hashlib.sha256(f.read()).hexdigest()
+        key = f"split_votes/{csv}"
+        if is_up_to_date(manifest, key, sha256, data_dir = data_dir):
+            continue
+
+        df= pd.read_csv(os.path.join(data_dir, "2016_2022", csv))
+        year= csv.split('_')[1][:4]
+        df["Year"]= year
+        df.to_csv(os.path.join(data_dir, "puntos_por_anho", csv), sep=',', encoding='utf-8', index=False)
+        manifest[key] = {"revision" : None, "sha256" : sha256, "output" : f'puntos_por_anho/{csv}'}
+        changed = True
+
+    if changed:
+        save_manifest(manifest, manifest_path)
 
-def get_wikipedia_data():
+def get_wikipedia_data(years = years, offline = False, refresh = False, manifest_path = manifest_path, data_dir = data_dir):
     """
-    This function stores csv files from wikipedia eurovision information in the paths:
-        /puntos_por_anho/filename.csv
+    This function stores csv files from wikipedia eurovision information in the paths (in `data_dir`):
+        /puntos_por_anho/filename.csv  (years before 2016, and the 2016-2022 files of /2016_2022)
         /canciones_por_anho/filename.csv
+
+    Runs are incremental: every file written is recorded in the manifest together with the revision
+    and hash of its page. Only years missing from the manifest (or whose file was deleted) are
+    downloaded, so adding a new year downloads a single page. With refresh = True every page is
+    revalidated and the years whose page has a new revision (or, for pages without one, a new hash) are
+    processed again.
+
+    With offline = True the pages are read only from the page cache in /cache/wikipedia.
     """
+    copy_split_votes(manifest_path, data_dir)
+    manifest = load_manifest(manifest_path)
 
-    print("Getting points per year from Wikipedia...")
+    def kinds(year):
+        return ["points", "songs"] if year < 2016 else ["songs"]
 
-    puntos_por_anho = get_table_points_year(years= list(range(1957,2016)))
+    pending = [year for year in years
+               if refresh or not all(is_up_to_date(manifest, f"{kind}/{year}", data_dir = data_dir) for kind in kinds(year))]
+    print(f"Getting tables for {len(pending)} of {len(years)} years from Wikipedia...")
 
-    for k,v in puntos_por_anho.items():
-        df= bs4_to_pandas_votes(v)
-        df["Year"] = k
-        df.to_csv(f'puntos_por_anho/{k}.csv', sep=',', encoding='utf-8', index=False)
+    pages = get_year_pages(pending, offline = offline)
+    written = 0
 
-    print("Tables puntos_por_anho created!")
-    print("Getting songs per year from Wikipedia...")
+    for year, raw_web in pages.items():
+        sha256 = hashlib.sha256(raw_web).hexdigest()
+        revision = page_revision(raw_web)
+        todo = [kind for kind in kinds(year)
+                if not is_up_to_date(manifest, f"{kind}/{year}", sha256, revision, data_dir)]
+        if not todo:
+            continue
 
-    anhos_y_canciones = get_table_songs_year()
+        votes_table, songs_table = extract_year_tables(raw_web)
+        tables = {"points" : (votes_table, bs4_to_pandas_votes, "puntos_por_anho"),
+                  "songs" : (songs_table, bs4_to_pandas_songs, "canciones_por_anho")}
+
+        for kind in todo:
+            table, to_pandas, folder = tables[kind]
+            output = None
+            if table is not None:
+                output = f'{folder}/{year}.csv'
+                df = to_pandas(table)
+                df["Year"] = year
+                df.to_csv(os.path.join(data_dir, output), sep=',', encoding='utf-8', index=False)
+                written += 1
+            manifest[f"{kind}/{year}"] = {
+                "revision" : revision,
+                "sha256" : sha256,
+                "output" : output}
+
+    save_manifest(manifest, manifest_path)
+    print(f"{written} tables written to /puntos_por_anho and /canciones_por_anho!")
 
-    for k,v in anhos_y_canciones.items():
-        try:
-            df= bs4_to_pandas_songs(v)
-            df["Year"] = k
-            df.to_csv(f'canciones_por_anho/{k}.csv', sep=',', encoding='utf-8', index=False)
-        except:
-            pass
 
-    print("Tables anhos_y_canciones created!")
+if __name__ == "__main__":
+    get_wikipedia_data()